@@ -0,0 +1,35 @@
+from linuxpy.video.device import PixelFormat
+import numpy as np
+import cv2
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    # Noise with some structure, so JPEG sizes are closer to a real scene
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+    cv2.putText(
+        image,
+        "compound-eyes",
+        (width // 8, height // 2),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        width / 400,
+        (255, 255, 255),
+        4,
+    )
+    return image
+
+
+def encode_frame_data(image: np.ndarray, pixel_format: PixelFormat) -> bytes:
+    if pixel_format == PixelFormat.MJPEG:
+        return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+    elif pixel_format == PixelFormat.YUYV:
+        height, width = image.shape[:2]
+        yuv = cv2.cvtColor(image, cv2.COLOR_BGR2YUV)
+        yuyv = np.empty((height, width, 2), dtype=np.uint8)
+        yuyv[:, :, 0] = yuv[:, :, 0]
+        yuyv[:, 0::2, 1] = yuv[:, 0::2, 1]
+        yuyv[:, 1::2, 1] = yuv[:, 1::2, 2]
+        return yuyv.tobytes()
+
+    raise Exception(f"Unknown pixel_format {pixel_format}")
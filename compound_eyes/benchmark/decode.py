@@ -0,0 +1,89 @@
+"""Allocation and time per frame for compound_eyes.convert_frame.
+
+    python -m compound_eyes.benchmark.decode --width 1600 --height 1304
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from linuxpy.video.device import Frame, PixelFormat
+
+from . import encode_frame_data, synthetic_image
+from ..convert_frame import FrameDecoder
+from ..recording import make_frame
+
+
+def legacy_process_frame(frame_data: Frame) -> np.ndarray:
+    # The pre-pooling YUYV path: a zeroed copy of every frame plus a fresh BGR image
+    frame_array = np.frombuffer(frame_data.data, dtype=np.uint8)
+    width = frame_data.format.width
+    height = frame_data.format.height
+    onto = np.zeros(height * width * 2, dtype=frame_array.dtype)
+    length = min(frame_array.size, onto.size)
+    onto[:length] = frame_array[:length]
+    image = onto.reshape((height, width, 2))
+    return cv2.cvtColor(image, cv2.COLOR_YUV2BGR_YUYV)
+
+
+def measure(decode, frames: list[Frame], warmup: int = 5) -> dict[str, float]:
+    for frame in frames[:warmup]:
+        decode(frame)
+
+    # Keep the previous image alive, like a consumer downstream would
+    held = None
+    allocated = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in frames:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        held = decode(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - base
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    del held
+
+    return {
+        "bytes_per_frame": allocated / len(frames),
+        "ms_per_frame": elapsed * 1000 / len(frames),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=1304)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    image = synthetic_image(args.width, args.height)
+    data = encode_frame_data(image, PixelFormat.YUYV)
+    frames = [
+        make_frame(data, args.width, args.height, PixelFormat.YUYV, sequence)
+        for sequence in range(args.frames)
+    ]
+    short_frames = [
+        make_frame(data[: len(data) * 3 // 4], args.width, args.height, PixelFormat.YUYV)
+        for _ in range(args.frames)
+    ]
+
+    decoder = FrameDecoder()
+    results = {
+        "legacy": measure(legacy_process_frame, frames),
+        "pooled": measure(decoder.process_frame, frames),
+        "pooled (short frames)": measure(decoder.process_frame, short_frames),
+    }
+
+    print(f"YUYV {args.width}x{args.height}, {args.frames} frames")
+    for name, result in results.items():
+        print(
+            f"{name:>22}: {result['bytes_per_frame'] / 2**20:8.2f} MiB allocated/frame"
+            f"  {result['ms_per_frame']:6.2f} ms/frame"
+        )
+
+
+if __name__ == "__main__":
+    main()
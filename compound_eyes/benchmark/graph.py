@@ -0,0 +1,538 @@
+"""Throughput and latency of camera graphs built from the real nodes.
+
+Each simulated camera builds the CameraGraph a Camera does (DecodeNode -> mode
+branch -> DebugNode) on the shared scheduler, fed from synthetic frames or a
+recording:
+
+    python -m compound_eyes.benchmark.graph --resolutions 640x480 1600x1304 \\
+        --cameras 1 4 --modes setup focus calibration --output bench.json
+
+Compare two runs with --compare old.json new.json.
+
+Each scenario also counts where the frames that weren't delivered went: skipped
+by a heavy node's Decimator, refused for being over the latency budget, or
+overwritten in a mailbox before the next node got to them. The latency budget
+bounds how old a frame may be when a heavy node takes it, not how old it is when
+it reaches the debug stream. Run in place, the node's own service time comes on
+top, and with as few scheduler workers as busy heavy nodes everything behind
+them waits for a worker too.
+"""
+import argparse
+import http.client
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+from linuxpy.video.device import Frame, PixelFormat
+from ntcore import NetworkTableInstance
+
+from . import encode_frame_data, synthetic_image
+from ..calibration_routine import CalibrationConfig, CalibrationRoutine, detector
+from ..camera_graph import CameraGraph
+from ..convert_frame import FrameDecoder
+from ..datatypes import Capture
+from ..debug_server import DebugServer
+from ..node import Scheduler
+from ..process_host import ProcessHost
+from ..recording import Recording, make_frame
+from ..tracing import LatencyTracker, now
+
+
+def calibration_config(width: int, height: int) -> CalibrationConfig:
+    # What the camera manager uses, so the detector does the same amount of work
+    return CalibrationConfig(
+        aruco_dict="DICT_4X4_1000",
+        board_size=(15, 15),
+        square_size=0.03,
+        marker_size=0.022,
+        capture_max=1000,
+        image_size=(width, height),
+        fov=55,
+        lens_model="LENSMODEL_OPENCV8",
+        device_name="benchmark",
+    )
+
+
+def board_image(width: int, height: int) -> np.ndarray:
+    board = detector(calibration_config(width, height)).getBoard()
+    image = board.generateImage((width, height), marginSize=height // 20)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def synthetic_frames(
+    width: int, height: int, pixel_format: PixelFormat, board: bool, count: int = 8
+) -> list[Frame]:
+    frames = []
+    for seed in range(count):
+        image = synthetic_image(width, height, seed)
+        if board:
+            # Something for Charuco detection to find, on a slightly moving scene
+            image = cv2.addWeighted(board_image(width, height), 0.85, image, 0.15, 0)
+        data = encode_frame_data(image, pixel_format)
+        frames.append(make_frame(data, width, height, pixel_format, seed))
+
+    return frames
+
+
+def recorded_frames(path: Path) -> list[Frame]:
+    recording = Recording(path)
+    return [
+        make_frame(
+            bytes(recording.data(recorded)),
+            recorded.width,
+            recorded.height,
+            recorded.pixel_format,
+            recorded.sequence,
+        )
+        for recorded in recording.frames
+    ]
+
+
+class SimulatedCamera:
+    # A Camera's graph in one mode, fed from a list of frames in a loop
+    def __init__(
+        self,
+        name: str,
+        mode: str,
+        frames: list[Frame],
+        scheduler: Scheduler,
+        server: DebugServer,
+        fps: float,
+        calibration_dir: Path,
+        calibration_rate: float | None,
+        latency_budget: float | None,
+        host: ProcessHost | None = None,
+    ):
+        self.name = name
+        self.frames = frames
+        self.fps = fps
+        self.decoder = FrameDecoder()
+        self.offered = 0
+
+        table = NetworkTableInstance.create().getTable(name)
+        self.latency = LatencyTracker(
+            table.getSubTable("latency"), name, window=100000
+        )
+
+        self.graph = CameraGraph(
+            name,
+            scheduler,
+            table,
+            server,
+            host,
+            latency=self.latency,
+            calibration_rate=calibration_rate,
+            latency_budget=latency_budget,
+        )
+        self.mode = mode
+
+        if mode == "calibration":
+            width, height = frames[0].format.width, frames[0].format.height
+            routine = CalibrationRoutine(calibration_config(width, height))
+            # Keep the saved captures out of the working directory
+            routine.dirpath = calibration_dir / name
+            routine.dirpath.mkdir(parents=True)
+            self.graph.calibration_node.begin_calibration(routine)
+
+        self._stop = False
+        self.thread = threading.Thread(name=name, target=self.feed)
+
+    def start(self):
+        self.graph.activate(self.mode)
+        self.thread.start()
+
+    def feed(self):
+        period = 1 / self.fps if self.fps else 0
+        due = time.monotonic()
+        sequence = 0
+        while not self._stop:
+            template = self.frames[sequence % len(self.frames)]
+            # Fresh timestamps, so latency is measured from when the frame was "taken"
+            frame = make_frame(
+                template.data,
+                template.format.width,
+                template.format.height,
+                template.format.pixel_format,
+                sequence,
+                now(),
+            )
+            self.graph.frames.put(Capture(frame, self.decoder))
+            self.offered += 1
+            sequence += 1
+
+            if period:
+                due += period
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                # Let the graph run between frames
+                time.sleep(0)
+
+    def stop(self):
+        self._stop = True
+        self.thread.join()
+        self.graph.stop()
+
+
+class Viewer:
+    # Reads a debug stream like a browser would, so the stream encodes frames
+    def __init__(self, port: int, camera: str):
+        self.url = f"http://127.0.0.1:{port}/cameras/{camera}/stream.mjpg"
+        self.received = 0
+        self._stop = False
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def read(self):
+        while not self._stop:
+            try:
+                with urllib.request.urlopen(self.url, timeout=2) as response:
+                    while not self._stop:
+                        chunk = response.read(65536)
+                        if not chunk:
+                            break
+                        self.received += len(chunk)
+            # The server closes the stream when its camera is unregistered
+            except (OSError, http.client.HTTPException):
+                time.sleep(0.1)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop = True
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def run_scenario(
+    frames: list[Frame],
+    mode: str,
+    cameras: int,
+    seconds: float,
+    fps: float,
+    workers: int | None,
+    viewers: bool,
+    port: int,
+    calibration_rate: float | None = 10.0,
+    latency_budget: float | None = 0.1,
+    process_workers: int = 0,
+) -> dict[str, Any]:
+    scheduler = Scheduler(workers)
+    host = ProcessHost(process_workers) if process_workers > 0 else None
+    if host is not None:
+        host.start()
+    server = DebugServer(port, "127.0.0.1")
+    server.start()
+    with tempfile.TemporaryDirectory() as calibration_dir:
+        simulated = [
+            SimulatedCamera(
+                f"bench{i}",
+                mode,
+                frames,
+                scheduler,
+                server,
+                fps,
+                Path(calibration_dir),
+                calibration_rate,
+                latency_budget,
+                host,
+            )
+            for i in range(cameras)
+        ]
+        watchers = (
+            [Viewer(port, camera.name) for camera in simulated] if viewers else []
+        )
+
+        for camera in simulated:
+            camera.start()
+        for viewer in watchers:
+            viewer.start()
+
+        # Let the scheduler, decoders and buffer pools warm up before measuring
+        time.sleep(min(1.0, seconds / 4))
+        for camera in simulated:
+            camera.latency.traces.clear()
+            camera.offered = 0
+
+        cpu_start = cpu_time()
+        wall_start = time.perf_counter()
+        time.sleep(seconds)
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_time() - cpu_start
+        rss = rss_bytes()
+
+        for viewer in watchers:
+            viewer.stop()
+        for camera in simulated:
+            camera.stop()
+        scheduler.shutdown()
+        server.stop()
+        if host is not None:
+            host.stop()
+
+    delivered = sum(len(camera.latency.traces) for camera in simulated)
+    offered = sum(camera.offered for camera in simulated)
+
+    # One tracker over every camera's traces, for percentiles across the scenario
+    merged = LatencyTracker(
+        NetworkTableInstance.create().getTable("merged"),
+        "merged",
+        window=delivered or 1,
+    )
+    for camera in simulated:
+        for trace in camera.latency.traces:
+            merged.record(trace)
+
+    nodes = {}
+    for camera in simulated:
+        for name, metrics in camera.graph.metrics().items():
+            node = nodes.setdefault(
+                name,
+                {
+                    "processed": 0,
+                    "dropped": 0,
+                    "skipped": 0,
+                    "late": 0,
+                    "overwritten": 0,
+                    "run_time": 0.0,
+                },
+            )
+            for key in node:
+                if key == "overwritten":
+                    node[key] += sum(
+                        edge["overwritten"] for edge in metrics["inputs"].values()
+                    )
+                else:
+                    node[key] += metrics[key]
+
+    return {
+        "mode": mode,
+        "cameras": cameras,
+        "workers": scheduler.workers,
+        "width": frames[0].format.width,
+        "height": frames[0].format.height,
+        "pixel_format": frames[0].format.pixel_format.name,
+        "seconds": wall,
+        "offered_fps": offered / wall,
+        "throughput_fps": delivered / wall,
+        "per_camera_fps": delivered / wall / cameras,
+        "cpu_percent": cpu / wall * 100,
+        "rss_mib": rss / 2**20,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        "latency_ms": {
+            stage: {f"p{p}": value * 1000 for p, value in percentiles.items()}
+            for stage, percentiles in merged.stats().items()
+        },
+        "nodes": nodes,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenario_key(result: dict[str, Any]) -> tuple:
+    return (
+        result["mode"],
+        result["cameras"],
+        result["width"],
+        result["height"],
+        result["pixel_format"],
+    )
+
+
+def compare(old_path: Path, new_path: Path):
+    old = {
+        scenario_key(result): result
+        for result in json.loads(old_path.read_text())["results"]
+    }
+    new = json.loads(new_path.read_text())["results"]
+
+    print(f"{'scenario':>36} {'fps':>16} {'total p95 ms':>20} {'cpu %':>16}")
+    for result in new:
+        before = old.get(scenario_key(result))
+        if before is None:
+            continue
+
+        p95 = result["latency_ms"].get("total", {}).get("p95", 0.0)
+        previous_p95 = before["latency_ms"].get("total", {}).get("p95", 0.0)
+        mode, cameras, width, height, pixel_format = scenario_key(result)
+        print(
+            f"{f'{mode} x{cameras} {width}x{height} {pixel_format}':>36}"
+            f" {change(before['throughput_fps'], result['throughput_fps']):>16}"
+            f" {change(previous_p95, p95):>20}"
+            f" {change(before['cpu_percent'], result['cpu_percent']):>16}"
+        )
+
+
+def change(before: float, after: float) -> str:
+    return f"{before:7.1f}->{after:7.1f}"
+
+
+def print_result(result: dict[str, Any]):
+    total = result["latency_ms"].get("total", {})
+    size = f"{result['width']}x{result['height']}"
+    print(
+        f"{result['mode']:>11} x{result['cameras']} {size}"
+        f" {result['pixel_format']:>5}: {result['throughput_fps']:7.1f} fps"
+        f" ({result['offered_fps']:7.1f} offered)"
+        f"  total p50 {total.get('p50', 0):6.1f} ms p95 {total.get('p95', 0):6.1f} ms"
+        f" p99 {total.get('p99', 0):6.1f} ms"
+        f"  cpu {result['cpu_percent']:5.0f}%  rss {result['rss_mib']:6.0f} MiB"
+    )
+
+    nodes = result["nodes"].values()
+    skipped = sum(node["skipped"] for node in nodes)
+    late = sum(node["late"] for node in nodes)
+    overwritten = sum(node["overwritten"] for node in nodes)
+    print(
+        f"{'':>36}  {skipped} skipped, {late} over the latency budget,"
+        f" {overwritten} overwritten waiting for a node"
+        f" ({result['workers']} scheduler workers)"
+    )
+
+
+def resolution(value: str) -> tuple[int, int]:
+    width, height = value.split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--resolutions", type=resolution, nargs="+", default=[(640, 480)]
+    )
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["setup", "focus", "calibration"],
+        default=["setup", "focus", "calibration"],
+    )
+    parser.add_argument("--pixel-format", choices=["MJPEG", "YUYV"], default="MJPEG")
+    parser.add_argument(
+        "--replay", type=Path, help="recording to use instead of synthetic frames"
+    )
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument(
+        "--fps", type=float, default=30.0, help="per camera, 0 for as fast as possible"
+    )
+    parser.add_argument("--workers", type=int, help="scheduler workers")
+    parser.add_argument(
+        "--process-workers",
+        type=int,
+        default=0,
+        help="processes running focus scoring and Charuco detection, 0 for in place",
+    )
+    parser.add_argument(
+        "--calibration-rate",
+        type=float,
+        default=10.0,
+        help="frames per second Charuco detection runs on, 0 for every frame",
+    )
+    parser.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        default=100.0,
+        help="age past which heavy nodes skip a frame, 0 for no limit",
+    )
+    parser.add_argument(
+        "--viewers",
+        action="store_true",
+        help="read every debug stream, so frames get encoded",
+    )
+    parser.add_argument(
+        "--port", type=int, default=5900, help="port serving the debug streams"
+    )
+    parser.add_argument("--output", type=Path, help="where to save the JSON results")
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="compare two result files",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    pixel_format = PixelFormat[args.pixel_format]
+    results = []
+    for size in [None] if args.replay else args.resolutions:
+        for mode in args.modes:
+            if size is None:
+                frames = recorded_frames(args.replay)
+            else:
+                frames = synthetic_frames(
+                    *size, pixel_format, board=mode == "calibration"
+                )
+
+            for cameras in args.cameras:
+                result = run_scenario(
+                    frames,
+                    mode,
+                    cameras,
+                    args.seconds,
+                    args.fps,
+                    args.workers,
+                    args.viewers,
+                    args.port,
+                    args.calibration_rate or None,
+                    args.latency_budget_ms / 1000 or None,
+                    args.process_workers,
+                )
+                print_result(result)
+                results.append(result)
+
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "commit": git_commit(),
+                    "time": time.time(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "args": {
+                        key: str(value) if isinstance(value, Path) else value
+                        for key, value in vars(args).items()
+                    },
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
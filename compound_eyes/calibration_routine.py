@@ -3,6 +3,7 @@ import numpy as np
 from dataclasses import dataclass
 from cv2 import aruco
 from .datatypes import Capture
+import functools
 import heapq
 import os
 from pathlib import Path
@@ -10,9 +11,9 @@ import shutil
 import math
 import subprocess
 import multiprocessing as mp
-from camera_model import CameraModel, from_file
+from .camera_model import CameraModel, from_file
 
-@dataclass
+@dataclass(frozen=True)
 class CalibrationConfig:
     aruco_dict: str
     board_size: tuple[int, int]
@@ -51,6 +52,16 @@ class CalibrationConfig:
         )
 
 
+@functools.cache
+def detector(config: CalibrationConfig) -> cv2.aruco.CharucoDetector:
+    return config.getDetector()
+
+
+def detect_board(image: np.ndarray, config: CalibrationConfig):
+    # Module level so a ProcessHost worker can run it, with a detector per process
+    return detector(config).detectBoard(image)
+
+
 def estimate_focal_length(fov, width, height):
     def calculateHorizontalVerticalFoV(fov, width, height):
         diagfov = math.radians(fov)
@@ -81,12 +92,18 @@ class CalibrationRoutine:
         self.capture_count = 0
 
     def run(self, capture: Capture):
+        self.apply(capture, self.detect(capture))
+
+    def detect(self, capture: Capture):
+        return self.detector.detectBoard(capture.gray)
+
+    def apply(self, capture: Capture, detection, paint: bool = True, scale: int = 1):
         (
             chessboard_corner_coords,
             chessboard_corner_ids,
             marker_corner_coords,
             marker_ids,
-        ) = self.detector.detectBoard(capture.image)
+        ) = detection
 
         if chessboard_corner_coords is not None:
             self.add_capture_to_calibration(
@@ -101,11 +118,22 @@ class CalibrationRoutine:
             count for (count, _, _, _) in self.corner_cache
         )
 
+        if paint:
+            self.paint(capture, marker_corner_coords, scale)
+
+    def paint(self, capture: Capture, marker_corner_coords, scale: int = 1):
+        # Corners are found at full size and drawn at 1/scale
+        image = capture.writable(scale)
         for val, _, _, corners in self.corner_cache:
-            cv2.aruco.drawDetectedCornersCharuco(capture.image, corners)
+            # OpenCV 5 returns (N, 2) corners, drawing wants (N, 1, 2)
+            cv2.aruco.drawDetectedCornersCharuco(
+                image, corners.reshape(-1, 1, 2) / scale
+            )
 
         if marker_corner_coords is not None:
-            cv2.aruco.drawDetectedMarkers(capture.image, marker_corner_coords)
+            cv2.aruco.drawDetectedMarkers(
+                image, [marker / scale for marker in marker_corner_coords]
+            )
 
     def add_capture_to_calibration(
         self, capture: Capture, ids: np.ndarray, corners: np.ndarray
@@ -132,6 +160,7 @@ class CalibrationRoutine:
 
         filename = f"img{self.capture_count}.png"
 
+        # Saved in color, grayscale is only what the detector works on
         cv2.imwrite(str(self.dirpath / filename), capture.image)
 
         return self.dirpath / filename
@@ -0,0 +1,109 @@
+from ntcore import NetworkTable
+from typing import Any, Callable
+
+from .datatypes import Capture
+from .debug_server import DebugServer
+from .node import Broadcast, DetectCharucoNode, FpsNode, Mailbox, ModeGraph, Scheduler
+from .node.apriltag import AprilTagNode
+from .node.decimate import Decimator
+from .node.decode import DecodeNode
+from .node.focus import FocusNode
+from .node.stream import DebugNode
+from .process_host import ProcessHost
+from .tracing import LatencyTracker
+
+
+class CameraGraph(ModeGraph):
+    # The nodes behind one camera. Raw frames are put on self.frames and decoded
+    # once into self.decoded, which feeds the mode branches on their way to the
+    # debug stream and anything else running next to them on the same frames.
+    # Camera builds it from its NetworkTables settings; the graph benchmark builds
+    # the same one, so what it measures is what runs on the robot.
+    def __init__(
+        self,
+        name: str,
+        scheduler: Scheduler,
+        table: NetworkTable,
+        debug_server: DebugServer,
+        host: ProcessHost | None = None,
+        decode_workers: int = 0,
+        overlay: Callable[[], bool] = lambda: True,
+        latency: LatencyTracker | None = None,
+        metrics: Callable[[], dict[str, Any]] | None = None,
+        calibration_rate: float | None = 10.0,
+        latency_budget: float | None = 0.1,
+        apriltag: bool = False,
+    ):
+        # Every raw frame, for whatever wants to consume the camera next to the graph
+        self.frames: Broadcast[Capture] = Broadcast()
+        # Every decoded frame, for the mode graph and the consumers running next to
+        # it on the same frames
+        self.decoded: Broadcast[Capture] = Broadcast()
+
+        super().__init__(
+            name,
+            scheduler,
+            table.getSubTable("nodes"),
+            self.decoded.tap("graph"),
+            Mailbox(),
+        )
+
+        self.decode_node = DecodeNode(
+            self.frames.tap("graph"),
+            self.decoded,
+            name,
+            decode_workers,
+            table.getSubTable("decode"),
+            # Only what the nodes reading self.decoded will look at
+            self.views,
+        )
+        self.debug_node = DebugNode(
+            name,
+            debug_server,
+            self.sink,
+            overlay,
+            scale=2,
+            latency=latency,
+            metrics=metrics,
+            table=table.getSubTable("measurements"),
+        )
+
+        self.add_node(self.decode_node)
+        self.add_mode(
+            "setup",
+            lambda source, sink: FpsNode(source, sink, "source"),
+        )
+        self.add_mode(
+            "focus",
+            lambda source, sink: FocusNode(
+                source,
+                sink,
+                name,
+                host,
+                Decimator(latency_budget=latency_budget),
+                # Overlays are only drawn while someone watches the debug stream
+                self.debug_node.preview,
+                self.debug_node.scale,
+            ),
+            lambda source, sink: FpsNode(source, sink, "focus"),
+        )
+        self.calibration_node, _ = self.add_mode(
+            "calibration",
+            lambda source, sink: DetectCharucoNode(
+                source,
+                sink,
+                name,
+                host,
+                Decimator(calibration_rate, latency_budget),
+                self.debug_node.preview,
+                self.debug_node.scale,
+            ),
+            lambda source, sink: FpsNode(source, sink, "calibration"),
+        )
+        self.add_node(self.debug_node)
+        if apriltag:
+            self.add_node(
+                AprilTagNode(
+                    self.decoded.tap("apriltag"), table.getSubTable("apriltag"), name
+                )
+            )
@@ -1,29 +1,69 @@
-from linuxpy.video.device import Device, iter_video_capture_files
+from linuxpy.video.device import Device, Frame, iter_video_capture_files
+from concurrent.futures import Future
 from ntcore import NetworkTable
 from pathlib import Path
-from queue import Queue
 
+import asyncio
 import logging
 import threading
+import time
+from typing import Any, Callable
 import traceback
 
 from .camera_controls_nt import CameraControlsTable
-from .convert_frame import process_frame
+from .camera_graph import CameraGraph
+from .convert_frame import FrameDecoder
+from .debug_server import DebugServer
+from .event_loop import EventLoopThread
 from .network_choice import NetworkChooser
+from .process_host import ProcessHost
+from .recording import FrameRecorder, ReplayDevice
+from .tracing import LatencyTracker
 from .datatypes import Capture
-from .node import Graph, FpsNode, DetectCharucoNode, SelectSink, SelectSource
-from .node.focus import FocusNode
-from .node.stream import DebugNode
+from .node import Mailbox, Scheduler
+from .node.sync import Bundle, SyncNode
 from .calibration_routine import CalibrationRoutine, CalibrationConfig
 
 
 class Camera:
-    def __init__(self, device: Device, parent: NetworkTable, debug_port: int):
+    def __init__(
+        self,
+        device: Device | ReplayDevice,
+        parent: NetworkTable,
+        debug_server: DebugServer,
+        scheduler: Scheduler,
+        recorder: FrameRecorder | None = None,
+        event_loop: EventLoopThread | None = None,
+        host: ProcessHost | None = None,
+    ):
         self.device = device
+        self.decoder = FrameDecoder()
+        self.recorder = recorder
 
         self.nt_table = parent.getSubTable(self.device.info.bus_info)
         role_topic = self.nt_table.getStringTopic("role")
         self.role_entry = role_topic.getEntry("Change Me!")
+        overlay_topic = self.nt_table.getBooleanTopic("overlay")
+        self.overlay_entry = overlay_topic.getEntry(True)
+        self.overlay_entry.setDefault(True)
+        overlay_topic.setPersistent(True)
+        decode_workers_topic = self.nt_table.getIntegerTopic("decode_workers")
+        self.decode_workers_entry = decode_workers_topic.getEntry(0)
+        self.decode_workers_entry.setDefault(0)
+        decode_workers_topic.setPersistent(True)
+        apriltag_topic = self.nt_table.getBooleanTopic("apriltag")
+        self.apriltag_entry = apriltag_topic.getEntry(False)
+        self.apriltag_entry.setDefault(False)
+        apriltag_topic.setPersistent(True)
+        # Heavy nodes skip frames to keep up, 0 turns either limit off
+        calibration_rate_topic = self.nt_table.getDoubleTopic("calibration_rate")
+        self.calibration_rate_entry = calibration_rate_topic.getEntry(10.0)
+        self.calibration_rate_entry.setDefault(10.0)
+        calibration_rate_topic.setPersistent(True)
+        latency_budget_topic = self.nt_table.getDoubleTopic("latency_budget_ms")
+        self.latency_budget_entry = latency_budget_topic.getEntry(100.0)
+        self.latency_budget_entry.setDefault(100.0)
+        latency_budget_topic.setPersistent(True)
         self.mode_entry = NetworkChooser(
             self.nt_table, "mode", ["setup", "focus", "calibration"], "setup"
         )
@@ -32,64 +72,59 @@ class Camera:
             self.device, self.nt_table.getSubTable("config")
         )
 
-        self.edges: list[Queue[Capture]] = [
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-            Queue(maxsize=1),
-        ]
-
-        self.nodes = [
-            SelectSink(
-                self.edges[0],
-                {
-                    "setup": self.edges[1],
-                    "focus": self.edges[2],
-                    "calibration": self.edges[3],
-                },
-                self.mode_entry.get,
-            ),
-            FpsNode(self.edges[1], self.edges[4], "source"),
-            FocusNode(self.edges[2], self.edges[5], self.device.info.bus_info),
-            DetectCharucoNode(self.edges[3], self.edges[6], self.device.info.bus_info),
-            FpsNode(self.edges[5], self.edges[7], "focus"),
-            FpsNode(self.edges[6], self.edges[8], "calibration"),
-            SelectSource(
-                {
-                    "setup": self.edges[4],
-                    "focus": self.edges[7],
-                    "calibration": self.edges[8],
-                },
-                self.edges[9],
-                self.mode_entry.get,
-            ),
-            DebugNode(self.device.info.bus_info, debug_port, self.edges[9]),
-        ]
-
-        self.calibration_node = self.nodes[3]
-
-        self.graph = Graph(self.device.info.bus_info)
-
-        for node in self.nodes:
-            self.graph.add_node(node)
+        self.latency = LatencyTracker(
+            self.nt_table.getSubTable("latency"), self.device.info.bus_info
+        )
+
+        # Only take effect when a camera is added
+        self.graph = CameraGraph(
+            self.device.info.bus_info,
+            scheduler,
+            self.nt_table,
+            debug_server,
+            host,
+            self.decode_workers_entry.get(),
+            self.overlay_entry.get,
+            self.latency,
+            self.metrics,
+            self.calibration_rate_entry.get() or None,
+            self.latency_budget_entry.get() / 1000 or None,
+            self.apriltag_entry.get(),
+        )
+        self.frames = self.graph.frames
+        self.decoded = self.graph.decoded
+        self.debug_node = self.graph.debug_node
+        self.calibration_node = self.graph.calibration_node
+        self.graph.activate(self.mode_entry.get())
 
+        self.event_loop = event_loop
         self.main_thread = threading.Thread(
             name=device.filename.name, target=self.main_loop
         )
+        self.main_future: Future | None = None
         self._stop = False
 
     def start(self):
-        self.main_thread.start()
+        if self.event_loop is None:
+            self.main_thread.start()
+        else:
+            self.main_future = self.event_loop.submit(self.main_loop_async())
 
-    def stop(self):
+    def stop(self, timeout: float = 2.0):
         self._stop = True
-        self.main_thread.join()
+        if self.main_future is None:
+            self.main_thread.join(timeout)
+            if self.main_thread.is_alive():
+                self.device.log.warning(f"Capture thread still running after {timeout}s")
+        else:
+            try:
+                self.main_future.result(timeout)
+            except TimeoutError:
+                # The device stopped yielding frames, so the loop never sees _stop
+                self.device.log.warning(
+                    f"Capture loop still waiting after {timeout}s, cancelling it"
+                )
+                self.main_future.cancel()
         self.graph.stop()
 
     def main_loop(self):
@@ -102,75 +137,189 @@ class Camera:
                 self.config_table.update()
 
                 for frame in self.device:
-                    normalized_frame = process_frame(frame)
-
-                    last_mode = self.mode_entry.get()
-                    self.mode_entry.periodic()
-                    mode = self.mode_entry.get()
-
-                    if not self.edges[0].full():
-                        self.edges[0].put(Capture(frame, normalized_frame))
-
-                    if last_mode == "calibration":
-                        if mode != last_mode:
-                            routine = self.calibration_node.end_calibration()
-
-                            if routine is not None:
-                                routine.finish()
-
-                                camera = routine.load_calibration()
-
-                                if camera is not None:
-                                    print("calibrated!!!", camera.intrinsics())
-                    elif mode == "calibration":
-                        routine = CalibrationRoutine(
-                            CalibrationConfig(
-                                aruco_dict="DICT_4X4_1000",
-                                board_size=(15, 15),
-                                square_size=0.03,
-                                marker_size=0.022,
-                                capture_max=1000,
-                                image_size=(
-                                    normalized_frame.shape[1],
-                                    normalized_frame.shape[0],
-                                ),
-                                fov=55,
-                                lens_model="LENSMODEL_OPENCV8",
-                                device_name=self.device.info.bus_info,
-                            )
-                        )
-
-                        routine.begin()
-
-                        self.calibration_node.begin_calibration(routine)
-
-                    if mode == "setup":
-                        if self.config_table.changed():
-                            break
-                    else:
-                        self.config_table.sync()
-
-                    if self._stop:
+                    if self.handle_frame(frame):
                         break
         except OSError as e:
             self.device.log.error(f"Something's wrong! {e}")
             traceback.print_exc()
         finally:
-            self.device.close()
+            self.close()
+
+    async def main_loop_async(self):
+        try:
+            self.device.open()
+
+            self.config_table.load_controls()
+
+            while not self._stop:
+                self.config_table.update()
+
+                async for frame in self.device:
+                    if self.handle_frame(frame):
+                        break
+        except OSError as e:
+            self.device.log.error(f"Something's wrong! {e}")
+            traceback.print_exc()
+        finally:
+            self.close()
+
+    def handle_frame(self, frame: Frame) -> bool:
+        """Hands one frame to the graph. Returns True when the stream has to restart."""
+        if self.recorder is not None:
+            self.recorder.write(frame)
+
+        self.latency.periodic()
+        self.graph.periodic()
+
+        last_mode = self.mode_entry.get()
+        self.mode_entry.periodic()
+        mode = self.mode_entry.get()
+        self.graph.activate(mode)
+
+        self.frames.put(Capture(frame, self.decoder))
+
+        if last_mode == "calibration":
+            if mode != last_mode:
+                routine = self.calibration_node.end_calibration()
+
+                if routine is not None:
+                    self.run_blocking(self.finish_calibration, routine)
+        elif mode == "calibration":
+            routine = CalibrationRoutine(
+                CalibrationConfig(
+                    aruco_dict="DICT_4X4_1000",
+                    board_size=(15, 15),
+                    square_size=0.03,
+                    marker_size=0.022,
+                    capture_max=1000,
+                    image_size=(frame.width, frame.height),
+                    fov=55,
+                    lens_model="LENSMODEL_OPENCV8",
+                    device_name=self.device.info.bus_info,
+                )
+            )
+
+            routine.begin()
+
+            self.calibration_node.begin_calibration(routine)
+
+        if mode == "setup":
+            if self.config_table.changed():
+                return True
+        else:
+            self.config_table.sync()
+
+        return self._stop
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "nodes": self.graph.metrics(),
+            "frames_dropped": self.frames.drops(),
+            "decoded_dropped": self.decoded.drops(),
+            "stream": self.debug_node.stream.get_encode_stats(),
+            "latency_ms": {
+                stage: {f"p{p}": value * 1000 for p, value in percentiles.items()}
+                for stage, percentiles in self.latency.stats().items()
+            },
+        }
+
+    def finish_calibration(self, routine: CalibrationRoutine):
+        routine.finish()
+
+        camera = routine.load_calibration()
+
+        if camera is not None:
+            print("calibrated!!!", camera.intrinsics())
+
+    def run_blocking(self, function: Callable[..., Any], *args):
+        if self.event_loop is None:
+            try:
+                function(*args)
+            except Exception:
+                self.device.log.exception(f"{function.__name__} failed")
+        else:
+            # Keep the shared loop free for the other cameras
+            future = self.event_loop.loop.run_in_executor(None, function, *args)
+            future.add_done_callback(
+                lambda future: self.log_failure(function.__name__, future)
+            )
+
+    def log_failure(self, name: str, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.device.log.error(f"{name} failed", exc_info=future.exception())
+
+    def close(self):
+        self.device.close()
+
+        if self.recorder is not None:
+            self.recorder.close()
 
 
 class CameraManager:
     logger = logging.getLogger("CameraManager")
 
-    def __init__(self, table: NetworkTable):
+    def __init__(
+        self,
+        table: NetworkTable,
+        record_dir: Path | None = None,
+        replay_files: list[Path] | None = None,
+        replay_speed: float | None = 1.0,
+        async_capture: bool = False,
+        process_workers: int = 0,
+        sync_tolerance: float | None = None,
+        debug_port: int = 5820,
+    ):
         self.table = table
-        self.debug_port = 5820
+        self.record_dir = record_dir
+        self.replay_files = [] if replay_files is None else replay_files
+        self.replay_speed = replay_speed
+
+        # All cameras dequeue frames on one event loop instead of a thread each
+        self.event_loop: EventLoopThread | None = None
+        if async_capture:
+            self.event_loop = EventLoopThread("capture")
+            self.event_loop.start()
+
+        # Every camera's debug stream is served by one server, on one port
+        self.debug_server = DebugServer(debug_port)
+        self.debug_server.start()
+
+        # Every camera's nodes share one worker pool, woken by edge writes
+        self.scheduler = Scheduler()
+
+        # Focus scoring and Charuco detection hold the GIL, so they can be moved
+        # out to worker processes
+        self.host: ProcessHost | None = None
+        if process_workers > 0:
+            self.host = ProcessHost(process_workers)
+            self.host.start()
+
+        # Time-aligned bundles of every camera's frames, for multi-view consumers.
+        # Captures are only bundled once a node subscribes to this edge.
+        self.bundles: Mailbox[Bundle] = Mailbox()
+        self.sync: SyncNode | None = None
+        if sync_tolerance is not None:
+            self.sync = SyncNode(
+                self.bundles, table.getSubTable("sync"), sync_tolerance
+            )
+            self.scheduler.add(self.sync)
 
         # Assigned in load_cameras()
         self.cameras: dict[Path, Camera | None] = {}
 
     def load_cameras(self):
-        capture_files = list(iter_video_capture_files())
+        capture_files = list(iter_video_capture_files()) + self.replay_files
+
+        # A replugged camera comes back under a new device file but the same name,
+        # so the old one has to let go of its stream and publication first
+        to_remove = [file for file in self.cameras if file not in capture_files]
+        for file in to_remove:
+            self.logger.info(f"Removing {file} from the camera manager.")
+            camera = self.cameras[file]
+            if camera is not None:
+                self.detach_sync(file, camera)
+                camera.stop()
+            del self.cameras[file]
 
         new_devices = 0
         for file in capture_files:
@@ -178,13 +327,22 @@ class CameraManager:
                 new_devices += 1
                 try:
                     self.logger.info(f"Adding {file} to the camera manager.")
-                    device = Device(file)
+                    device = self.create_device(file)
                     device.open()
-                    camera = Camera(device, self.table, self.debug_port)
+                    camera = Camera(
+                        device,
+                        self.table,
+                        self.debug_server,
+                        self.scheduler,
+                        self.create_recorder(device),
+                        self.event_loop,
+                        self.host,
+                    )
+                    if self.sync is not None:
+                        self.sync.attach(str(file), camera.frames.tap("sync"))
                     camera.start()
 
                     self.cameras[file] = camera
-                    self.debug_port += 1
                 except Exception as e:
                     self.logger.error(
                         f"Cannot monitor {file} due to {e}. Will not try again until it is removed."
@@ -195,19 +353,43 @@ class CameraManager:
         if new_devices:
             self.logger.info(f"Found {new_devices} video devices.")
 
-        to_remove = [file for file in self.cameras if file not in capture_files]
-        for file in to_remove:
-            self.logger.info(f"Removing {file} from the camera manager.")
-            camera = self.cameras[file]
-            if camera is not None:
-                camera.stop()
-            del self.cameras[file]
+    def detach_sync(self, file: Path, camera: Camera):
+        if self.sync is not None:
+            self.sync.detach(str(file))
+            camera.frames.untap("sync")
+
+    def create_device(self, file: Path) -> Device | ReplayDevice:
+        if file in self.replay_files:
+            return ReplayDevice(file, self.replay_speed)
+
+        return Device(file)
+
+    def create_recorder(self, device: Device | ReplayDevice) -> FrameRecorder | None:
+        if self.record_dir is None or isinstance(device, ReplayDevice):
+            return None
+
+        path = self.record_dir / f"{device.filename.name}_{int(time.time())}.frames"
+        self.logger.info(f"Recording {device.filename} to {path}.")
+        return FrameRecorder(path, device)
 
     def unload_cameras(self):
         for file, camera in self.cameras.items():
             if camera is not None:
                 self.logger.info(f"Waiting on {file}...")
+                self.detach_sync(file, camera)
                 camera.stop()
                 self.logger.info(f"{file} closed...")
 
         self.cameras = {}
+
+        if self.sync is not None:
+            self.scheduler.remove(self.sync)
+        self.scheduler.shutdown()
+
+        if self.host is not None:
+            self.host.stop()
+
+        self.debug_server.stop()
+
+        if self.event_loop is not None:
+            self.event_loop.stop()
@@ -1,53 +1,146 @@
 from linuxpy.video.device import Frame, PixelFormat
 import numpy as np
 import cv2
+from .datatypes import FramePool
 
 
-def process_frame(frame_data: Frame) -> np.ndarray:
-    """Process raw frame data into OpenCV image"""
-    # Convert frame data to numpy array
-    frame_array = np.frombuffer(frame_data.data, dtype=np.uint8)
+# Reduced JPEG decodes scale in the DCT domain, which is much cheaper than
+# decoding at full size and resizing afterwards
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class FrameDecoder:
+    # Per-camera decoder that reuses its scratch and output buffers between frames
+    def __init__(self, pool_size: int = 8):
+        self.pool = FramePool(pool_size)
+
+    def yuyv_view(self, frame_data: Frame) -> np.ndarray:
+        """(height, width, 2) YUYV view of the frame, padding only short frames"""
+        width = frame_data.format.width
+        height = frame_data.format.height
+        frame_array = np.frombuffer(frame_data.data, dtype=np.uint8)
+
+        size = height * width * 2
+        if frame_array.size >= size:
+            return frame_array[:size].reshape((height, width, 2))
+
+        # frame is incomplete - copy it into a full-size scratch buffer
+        onto = self.pool.acquire((height, width, 2))
+        flat = onto.reshape(-1)
+        flat[: frame_array.size] = frame_array
+        flat[frame_array.size :] = 0
+        return onto
 
-    try:
+    def luma(self, frame_data: Frame, scale: int = 1) -> np.ndarray:
+        """Grayscale view of a YUYV frame: every other byte is already the Y plane"""
+        return self.yuyv_view(frame_data)[::scale, ::scale, 0]
+
+    def process_frame(self, frame_data: Frame) -> np.ndarray:
+        """Process raw frame data into OpenCV image"""
         current_format = frame_data.format
-        pixel_format = current_format.pixel_format
         width = current_format.width
         height = current_format.height
 
-        # Handle different pixel formats
-        if pixel_format == PixelFormat.YUYV:
-            # YUYV format - 2 bytes per pixel
-            # frame might be incomplete - that's why we copy it into a full-size array
-            width = current_format.width
-            height = current_format.height
-            onto = np.zeros(height * width * 2, dtype=frame_array.dtype)
-            length = min(frame_array.size, onto.size)
-            onto[:length] = frame_array[:length]
-            image = onto.reshape((height, width, 2))
-            image = cv2.cvtColor(image, cv2.COLOR_YUV2BGR_YUYV)
-        elif pixel_format == PixelFormat.MJPEG:
-            # JPEG format - decode as JPEG
-            image = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
-            if image is None:
-                raise ValueError("Failed to decode JPEG")
-        else:
-            raise Exception(f"Unknown pixel_format {pixel_format}")
+        try:
+            pixel_format = current_format.pixel_format
 
-        return image
+            # Handle different pixel formats
+            if pixel_format == PixelFormat.YUYV:
+                image = cv2.cvtColor(
+                    self.yuyv_view(frame_data),
+                    cv2.COLOR_YUV2BGR_YUYV,
+                    dst=self.pool.acquire((height, width, 3)),
+                )
+            elif pixel_format == PixelFormat.MJPEG:
+                # JPEG format - decode as JPEG
+                frame_array = np.frombuffer(frame_data.data, dtype=np.uint8)
+                image = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
+                if image is None:
+                    raise ValueError("Failed to decode JPEG")
+            else:
+                raise Exception(f"Unknown pixel_format {pixel_format}")
 
-    except Exception as e:
-        print(
-            f"Error processing frame: could not decode {frame_data.pixel_format.name} {e}"
-        )
-        # Return a simple error display
-        image = np.zeros((height, width, 3), dtype=np.uint8)
-        cv2.putText(
+            return image
+
+        except Exception as e:
+            print(
+                f"Error processing frame: could not decode {frame_data.pixel_format.name} {e}"
+            )
+            return error_image(width, height)
+
+    def shrink(
+        self, image: np.ndarray, scale: int, grayscale: bool = False
+    ) -> np.ndarray:
+        """Reduce an already decoded BGR image"""
+        if grayscale:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        if scale == 1:
+            return image
+
+        return cv2.resize(
             image,
-            "Frame processing error",
-            (10, height // 2),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1,
-            (0, 0, 255),
-            2,
+            (image.shape[1] // scale, image.shape[0] // scale),
+            interpolation=cv2.INTER_AREA,
         )
+
+    def process_frame_reduced(
+        self, frame_data: Frame, scale: int, grayscale: bool = False
+    ) -> np.ndarray:
+        """Process raw frame data into an OpenCV image 1/scale the size"""
+        if scale not in REDUCED_COLOR_FLAGS:
+            raise ValueError(
+                f"Unsupported scale {scale}, expected one of {list(REDUCED_COLOR_FLAGS)}"
+            )
+
+        current_format = frame_data.format
+        if current_format.pixel_format == PixelFormat.YUYV and grayscale:
+            return self.luma(frame_data, scale)
+        elif current_format.pixel_format != PixelFormat.MJPEG:
+            return self.shrink(self.process_frame(frame_data), scale, grayscale)
+
+        flags = REDUCED_GRAYSCALE_FLAGS if grayscale else REDUCED_COLOR_FLAGS
+        frame_array = np.frombuffer(frame_data.data, dtype=np.uint8)
+        image = cv2.imdecode(frame_array, flags[scale])
+        if image is None:
+            print(
+                f"Error processing frame: could not decode {frame_data.pixel_format.name} Failed to decode JPEG"
+            )
+            image = error_image(
+                current_format.width // scale, current_format.height // scale
+            )
+            if grayscale:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
         return image
+
+
+def error_image(width: int, height: int) -> np.ndarray:
+    # Return a simple error display
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.putText(
+        image,
+        "Frame processing error",
+        (10, height // 2),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1,
+        (0, 0, 255),
+        2,
+    )
+    return image
+
+
+def process_frame(frame_data: Frame) -> np.ndarray:
+    """Process raw frame data into OpenCV image, without buffer reuse"""
+    return FrameDecoder(pool_size=0).process_frame(frame_data)
@@ -1,15 +1,304 @@
-from linuxpy.video.device import Frame
-from dataclasses import dataclass, field
+from __future__ import annotations
+
+from linuxpy.video.device import Frame, PixelFormat
 import numpy as np
-from typing import Any
+import sys
+import threading
+import weakref
+from typing import Any, TYPE_CHECKING
+from .tracing import Trace, now
+
+if TYPE_CHECKING:
+    from .convert_frame import FrameDecoder
+
+
+class BufferPool:
+    # Hands out preallocated arrays of a single shape. A buffer is recycled once
+    # nothing outside the pool references it (views keep their base alive), so
+    # images that are still travelling through the graph are never overwritten.
+    _POOL_ONLY_REFCOUNT = 2  # the pool's list + the getrefcount() argument
+
+    def __init__(self, shape: tuple[int, ...], dtype=np.uint8, max_size: int = 8):
+        self.shape = shape
+        self.dtype = dtype
+        self.max_size = max_size
+        self._buffers: list[np.ndarray] = []
+
+    def acquire(self) -> np.ndarray:
+        for i in range(len(self._buffers)):
+            if sys.getrefcount(self._buffers[i]) <= self._POOL_ONLY_REFCOUNT:
+                return self._buffers[i]
+
+        buffer = np.empty(self.shape, dtype=self.dtype)
+        if len(self._buffers) < self.max_size:
+            self._buffers.append(buffer)
+
+        return buffer
+
+    def holds(self, buffer: np.ndarray) -> bool:
+        return any(pooled is buffer for pooled in self._buffers)
+
+
+class FramePool:
+    # Per-camera image buffers, one BufferPool per shape
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self._pools: dict[tuple[int, ...], BufferPool] = {}
+        # Captures are decoded lazily, from whichever node thread gets there first
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            pool = self._pools.get(shape)
+            if pool is None:
+                pool = BufferPool(shape, max_size=self.max_size)
+                self._pools[shape] = pool
+
+            return pool.acquire()
+
+    def holds(self, array: np.ndarray) -> bool:
+        """Whether the array is one of the pool's buffers, which the pool references"""
+        with self._lock:
+            pool = self._pools.get(array.shape)
+            return pool is not None and pool.holds(array)
+
+    def copy(self, array: np.ndarray) -> np.ndarray:
+        buffer = self.acquire(array.shape)
+        np.copyto(buffer, array)
+        return buffer
+
+
+def readonly(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+FULL = (1, False)
+
+
+def decode_stage(scale: int, grayscale: bool) -> str:
+    if (scale, grayscale) == FULL:
+        return "decode"
+
+    return f"decode_{'gray' if grayscale else 'color'}/{scale}"
+
+
+class DecodedFrame:
+    # Lazily decoded pixels of one raw frame, shared by every Capture of that frame.
+    # Captures retain it while alive; the owner count decides whether a capture that
+    # wants to draw may do so in place.
+    _UNSEEN_REFCOUNT = 3  # self._images, take()'s local + the getrefcount() argument
+
+    def __init__(self, frame: Frame, decoder: FrameDecoder):
+        self.frame = frame
+        self.decoder = decoder
+        self._images: dict[tuple[int, bool], np.ndarray] = {}
+        # Images an owner has drawn on, which must not be used to derive others
+        self._tainted: set[tuple[int, bool]] = set()
+        # Decode timings, shared by the traces of every Capture of this frame
+        self.spans: list[tuple[str, float, float]] = []
+        self._owners = 0
+        self._lock = threading.RLock()
+
+    @property
+    def owners(self) -> int:
+        return self._owners
+
+    def retain(self):
+        with self._lock:
+            self._owners += 1
+
+    def release(self):
+        with self._lock:
+            self._owners -= 1
+
+    @property
+    def decoded(self) -> bool:
+        return FULL in self._images
+
+    def get(self, scale: int = 1, grayscale: bool = False) -> np.ndarray:
+        key = (scale, grayscale)
+        image = self._images.get(key)
+        if image is None:
+            with self._lock:
+                image = self._images.get(key)
+                if image is None:
+                    start = now()
+                    image = self._decode(scale, grayscale)
+                    self._images[key] = image
+                    self.spans.append((decode_stage(scale, grayscale), start, now()))
+
+        return image
+
+    def _decode(self, scale: int, grayscale: bool) -> np.ndarray:
+        if (scale, grayscale) == FULL:
+            return self.decoder.process_frame(self.frame)
+
+        luma = grayscale and self.frame.format.pixel_format == PixelFormat.YUYV
+        if FULL in self._images and FULL not in self._tainted and not luma:
+            # Already paid for the full decode, shrinking it is cheaper
+            return self.decoder.shrink(self._images[FULL], scale, grayscale)
+
+        return self.decoder.process_frame_reduced(self.frame, scale, grayscale)
+
+    def take(self, scale: int) -> np.ndarray | None:
+        """The decoded color image itself, if no other owner can see it"""
+        key = (scale, False)
+        with self._lock:
+            image = self.get(scale)
+            if not image.flags.writeable:
+                return None
+
+            if self._owners != 1:
+                # Other captures of this frame, say one waiting in a sync buffer,
+                # only see this image if they asked for it. If none holds it, hand
+                # it over and let them decode their own should they ever ask.
+                unseen = self._UNSEEN_REFCOUNT
+                if self.decoder.pool.holds(image):
+                    # The pool's list, which only recycles the buffer once no
+                    # capture references it
+                    unseen += 1
+                if sys.getrefcount(image) > unseen:
+                    return None
+
+                del self._images[key]
+                return image
+
+            self._tainted.add(key)
+            return image
 
 
-@dataclass
 class Capture:
-    frame: Frame
-    image: np.ndarray
-    metadata: dict[str, Any] = field(default_factory=dict)
+    # Holds the raw frame; pixels are only decoded once a node asks for them.
+    # Images are handed out read-only. A node that draws asks for writable(), which
+    # draws in place when nothing else shares the pixels and copies otherwise.
+    def __init__(
+        self,
+        frame: Frame | DecodedFrame,
+        decoder: FrameDecoder | None = None,
+        metadata: dict[str, Any] | None = None,
+        trace: Trace | None = None,
+    ):
+        if isinstance(frame, DecodedFrame):
+            self.decoded_frame = frame
+        elif decoder is not None:
+            self.decoded_frame = DecodedFrame(frame, decoder)
+        else:
+            raise ValueError("A raw frame needs a decoder")
+
+        if trace is None:
+            # A fresh capture is made right after the frame is dequeued
+            trace = Trace(
+                self.frame.timestamp, self.frame.frame_nb, self.decoded_frame.spans
+            )
+            trace.add_span("dequeue", trace.origin, now())
+        self.trace = trace
+
+        self.decoded_frame.retain()
+        weakref.finalize(self, self.decoded_frame.release)
+
+        self.metadata: dict[str, Any] = {} if metadata is None else metadata
+        # Images this capture has drawn on, and which of those a copy still shares
+        self._overlays: dict[tuple[int, bool], np.ndarray] = {}
+        self._shared_overlays: set[tuple[int, bool]] = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Capture(frame={self.frame!r}, metadata={self.metadata!r})"
+
+    @property
+    def frame(self) -> Frame:
+        return self.decoded_frame.frame
+
+    @property
+    def decoder(self) -> FrameDecoder:
+        return self.decoded_frame.decoder
+
+    @property
+    def width(self) -> int:
+        return self.frame.format.width
+
+    @property
+    def height(self) -> int:
+        return self.frame.format.height
+
+    @property
+    def decoded(self) -> bool:
+        return self.decoded_frame.decoded
+
+    @property
+    def drawn(self) -> bool:
+        return len(self._overlays) != 0
+
+    @property
+    def image(self) -> np.ndarray:
+        return self.reduced()
+
+    def reduced(self, scale: int = 1, grayscale: bool = False) -> np.ndarray:
+        """The image at 1/scale resolution, decoded for the consumer that asks.
+
+        Color views include whatever this capture has drawn so far, grayscale views
+        are always the clean camera image. Both are read-only.
+        """
+        key = (scale, grayscale)
+        with self._lock:
+            image = self._overlays.get(key)
+            if image is None and not grayscale and FULL in self._overlays:
+                # Carry drawings made at full size over to the smaller image
+                image = self.decoder.shrink(self._overlays[FULL], scale)
+                self._overlays[key] = image
+
+        if image is None:
+            image = self.decoded_frame.get(scale, grayscale)
+
+        return readonly(image)
+
+    @property
+    def gray(self) -> np.ndarray:
+        # A strided view of the luma plane for YUYV, IMREAD_GRAYSCALE for MJPEG.
+        # The view skips the color conversion, not the copy: OpenCV copies
+        # non-contiguous input before it works on it.
+        return self.reduced(1, grayscale=True)
+
+    def writable(self, scale: int = 1) -> np.ndarray:
+        """A color image at 1/scale resolution that this capture may draw on"""
+        key = (scale, False)
+        with self._lock:
+            image = self._overlays.get(key)
+            if image is not None and key not in self._shared_overlays:
+                return image
+
+            if image is not None:
+                image = self.decoder.pool.copy(image)
+            elif FULL in self._overlays:
+                image = self.decoder.shrink(self._overlays[FULL], scale)
+            else:
+                image = self.decoded_frame.take(scale)
+                if image is None:
+                    image = self.decoder.pool.copy(self.decoded_frame.get(scale))
+
+            self._overlays[key] = image
+            self._shared_overlays.discard(key)
+            return image
+
+    @property
+    def jpeg(self) -> np.ndarray | None:
+        # The camera's own encoding, only valid while nothing is drawn on the image
+        if self.frame.format.pixel_format != PixelFormat.MJPEG or self.drawn:
+            return None
+
+        return np.frombuffer(self.frame.data, dtype=np.uint8)
 
     def copy(self):
-        # Only clone the things that are written to by the application
-        return Capture(self.frame, self.image.copy(), self.metadata.copy())
+        # No pixels are copied; whichever capture draws next copies first
+        with self._lock:
+            capture = Capture(
+                self.decoded_frame,
+                metadata=self.metadata.copy(),
+                trace=self.trace.copy(),
+            )
+            capture._overlays = dict(self._overlays)
+            capture._shared_overlays = set(self._overlays)
+            self._shared_overlays = set(self._overlays)
+            return capture
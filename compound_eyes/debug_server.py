@@ -0,0 +1,184 @@
+from aiohttp import web
+from html import escape
+from mjpeg_streamer.server import _StreamHandler
+from mjpeg_streamer.stream import StreamBase
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable
+from urllib.parse import quote
+
+import asyncio
+import logging
+
+from .event_loop import EventLoopThread
+
+
+@dataclass(eq=False)
+class Registration:
+    # One camera's stream, and the handlers serving it. Returned by register() as
+    # the token for unregister(), so a camera that is stopped after it was
+    # replugged can't take down the stream of the camera that replaced it.
+    name: str
+    stream: StreamBase
+    metrics: Callable[[], dict[str, Any]] | None = None
+    viewers: set[asyncio.Task] = field(default_factory=set)
+
+    @property
+    def path(self) -> str:
+        return DebugServer.path(self.name) + "stream.mjpg"
+
+
+class DebugServer:
+    # One aiohttp application on one event loop and one port, serving the debug
+    # stream of every camera at /cameras/<bus_info>/stream.mjpg. Cameras register
+    # and unregister as they come and go; the routes look streams up by name, so
+    # the application itself never changes and a camera that comes back is served
+    # at the same URL.
+    logger = logging.getLogger("DebugServer")
+
+    def __init__(
+        self,
+        port: int = 5820,
+        host: str = "0.0.0.0",
+        event_loop: EventLoopThread | None = None,
+    ):
+        self.port = port
+        self.host = host
+
+        self._owns_loop = event_loop is None
+        self.event_loop = event_loop or EventLoopThread("debug")
+
+        self._lock = Lock()
+        self.registrations: dict[str, Registration] = {}
+
+        self.app = web.Application()
+        self.app.router.add_get("/", self.index_handler)
+        self.app.router.add_get("/cameras/{name}/", self.page_handler)
+        self.app.router.add_get("/cameras/{name}/stream.mjpg", self.stream_handler)
+        self.app.router.add_get("/cameras/{name}/metrics", self.metrics_handler)
+        self.runner: web.AppRunner | None = None
+
+    @staticmethod
+    def path(name: str) -> str:
+        return f"/cameras/{quote(name, safe='')}/"
+
+    def start(self):
+        if self._owns_loop:
+            self.event_loop.start()
+        self.event_loop.submit(self._start()).result()
+        self.logger.info(f"Serving debug streams on port {self.port}.")
+
+    async def _start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        # Restarting shouldn't have to wait for the old socket to time out
+        site = web.TCPSite(self.runner, self.host, self.port, reuse_address=True)
+        await site.start()
+
+    def register(
+        self,
+        name: str,
+        stream: StreamBase,
+        metrics: Callable[[], dict[str, Any]] | None = None,
+    ) -> Registration:
+        """Serves the stream under the camera's name, replacing any earlier one"""
+        registration = Registration(name, stream, metrics)
+        with self._lock:
+            self.registrations[name] = registration
+
+        return registration
+
+    def unregister(self, registration: Registration):
+        with self._lock:
+            if self.registrations.get(registration.name) is registration:
+                del self.registrations[registration.name]
+            viewers = set(registration.viewers)
+            registration.viewers.clear()
+
+        # Nothing will be set on the stream anymore, so its viewers would wait forever
+        for task in viewers:
+            self.event_loop.loop.call_soon_threadsafe(task.cancel)
+
+    def stop(self):
+        if self.runner is not None:
+            self.event_loop.submit(self.runner.cleanup()).result()
+            self.runner = None
+
+        if self._owns_loop:
+            self.event_loop.stop()
+
+    async def index_handler(self, request: web.Request) -> web.Response:
+        with self._lock:
+            names = sorted(self.registrations)
+
+        items = "".join(
+            f'<li><a href="{self.path(name)}">{escape(name)}</a></li>'
+            for name in names
+        )
+        text = f"""
+    <html>
+        <head>
+            <title>RJVision Debug</title>
+        </head>
+        <body>
+            <ul>{items}</ul>
+        </body>
+    </html>
+            """
+        return web.Response(text=text, content_type="text/html")
+
+    async def page_handler(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        with self._lock:
+            if name not in self.registrations:
+                raise web.HTTPNotFound()
+
+        text = f"""
+    <html>
+        <head>
+            <title>{escape(name)}</title>
+            <style>
+                body {{
+                    background-color: black;
+                }}
+
+                img {{
+                    position: absolute;
+                    left: 50%;
+                    top: 50%;
+                    transform: translate(-50%, -50%);
+                    max-width: 100%;
+                    max-height: 100%;
+                }}
+            </style>
+        </head>
+        <body>
+            <img src="stream.mjpg" />
+        </body>
+    </html>
+            """
+        return web.Response(text=text, content_type="text/html")
+
+    async def stream_handler(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        task = asyncio.current_task()
+        with self._lock:
+            registration = self.registrations.get(name)
+            if registration is None:
+                raise web.HTTPNotFound()
+            registration.viewers.add(task)
+
+        try:
+            return await _StreamHandler(registration.stream)(request)
+        finally:
+            with self._lock:
+                registration.viewers.discard(task)
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        with self._lock:
+            registration = self.registrations.get(request.match_info["name"])
+        metrics = registration.metrics if registration is not None else None
+        if metrics is None:
+            raise web.HTTPNotFound()
+
+        return web.json_response(metrics())
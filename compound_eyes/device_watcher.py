@@ -0,0 +1,117 @@
+from pathlib import Path
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT = struct.Struct("iIII")
+
+
+class DeviceWatcher:
+    # Wakes the camera manager when a video device appears in or leaves /dev, using
+    # inotify instead of enumerating every device on a timer. udev creates the node
+    # first and fixes its permissions after (IN_ATTRIB), and a USB camera being
+    # re-enumerated comes and goes several times, so changes are reported once the
+    # directory has been quiet for the debounce period. Without inotify it falls
+    # back to reporting a change every poll period, like polling did.
+    logger = logging.getLogger("DeviceWatcher")
+
+    def __init__(
+        self,
+        path: Path = Path("/dev"),
+        prefix: str = "video",
+        debounce: float = 0.25,
+        poll: float = 0.1,
+    ):
+        self.path = path
+        self.prefix = prefix.encode()
+        self.debounce = debounce
+        self.poll = poll
+        self.fd: int | None = None
+
+        try:
+            self.fd = self._open()
+        except OSError as e:
+            self.logger.warning(f"inotify unavailable, polling {path} instead: {e}")
+
+    def _open(self) -> int:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        mask = IN_CREATE | IN_DELETE | IN_ATTRIB
+        if libc.inotify_add_watch(fd, bytes(self.path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno))
+
+        return fd
+
+    def _read(self, timeout: float | None) -> bool | None:
+        """Whether the events that arrived within timeout touched a video device.
+        None if nothing arrived."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return None
+
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return None
+
+        relevant = False
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size : offset + EVENT.size + length]
+            offset += EVENT.size + length
+
+            # Events were lost, so anything may have changed
+            if mask & IN_Q_OVERFLOW or name.startswith(self.prefix):
+                relevant = True
+
+        return relevant
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until video devices changed and settled. False on timeout."""
+        if self.fd is None:
+            time.sleep(self.poll if timeout is None else min(timeout, self.poll))
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+
+            if self._read(remaining) is True:
+                break
+
+        # Let a burst of events settle before anyone enumerates the devices. Any
+        # event restarts the quiet period, udev touches more than video* nodes
+        # (media*, v4l/by-id links) while it sets a camera up.
+        while self._read(self.debounce) is not None:
+            pass
+
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,29 @@
+from concurrent.futures import Future
+from threading import Thread
+from typing import Any, Coroutine
+
+import asyncio
+
+
+class EventLoopThread:
+    # An asyncio event loop running on its own thread, shared by everything that
+    # mostly waits on I/O. CPU-heavy work belongs in an executor, not on this loop.
+    def __init__(self, name: str):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(name=name, target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, coroutine: Coroutine[Any, Any, Any]) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,117 @@
+from bisect import bisect_left
+from ntcore import DoublePublisher, NetworkTable
+from typing import Any
+
+# Upper bounds of the histogram buckets, in seconds. The last bucket catches the rest.
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Histogram:
+    # Fixed buckets, so recording is a bisect and an increment no matter how many
+    # samples there are. Percentiles are the upper bound of the bucket they land in,
+    # or the last bound for the overflow bucket.
+    def __init__(self, bounds: tuple[float, ...] = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        rank = self.count * percentile / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count != 0:
+                break
+
+        # The overflow bucket has no upper bound; reporting its lower one keeps the
+        # snapshot valid JSON, and the bucket counts show how many went past it
+        return self.bounds[min(i, len(self.bounds) - 1)]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "buckets_ms": {
+                (f"{bound * 1000:g}" if i < len(self.bounds) else "inf"): count
+                for i, (bound, count) in enumerate(
+                    zip(self.bounds + (float("inf"),), self.counts)
+                )
+            },
+        }
+
+
+class NodeMetrics:
+    # Counters for one node, updated from whichever scheduler worker runs it
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        # Forwarded without being processed, to keep up with the camera
+        self.skipped = 0
+        # Skipped because they were older than the node's latency budget
+        self.late = 0
+        self.service_time = Histogram()
+        # How old a frame is, since V4L2 timestamped it, when the node takes it
+        self.input_age = Histogram()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "late": self.late,
+            "service_time": self.service_time.snapshot(),
+            "input_age": self.input_age.snapshot(),
+        }
+
+
+class MetricsPublisher:
+    # Publishes a nested dict of numbers to NetworkTables, one subtable per level
+    def __init__(self, table: NetworkTable):
+        self.table = table
+        self.publishers: dict[tuple[str, ...], DoublePublisher] = {}
+
+    def publish(self, metrics: dict[str, Any]):
+        self._publish(self.table, (), metrics)
+
+    def _publish(self, table: NetworkTable, path: tuple[str, ...], metrics: dict):
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                if key == "buckets_ms":
+                    # Too many topics for too little use, they're on /metrics
+                    continue
+
+                self._publish(table.getSubTable(key), path + (key,), value)
+                continue
+
+            publisher = self.publishers.get(path + (key,))
+            if publisher is None:
+                publisher = table.getDoubleTopic(key).publish()
+                self.publishers[path + (key,)] = publisher
+
+            publisher.set(float(value))
@@ -1,127 +1,382 @@
-from queue import Queue, Empty
+from queue import Empty
 
-from threading import Thread
+from .decimate import Decimator
+from .edge import Broadcast, Edge, Mailbox
 from .fps_counter import FpsCounter
+from .scheduler import Scheduler
+from ntcore import NetworkTable
 import cv2
 import logging
-from typing import Callable
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
 from dataclasses import dataclass
 from cv2 import aruco
 from ..datatypes import Capture
-from ..calibration_routine import CalibrationRoutine
+from ..metrics import MetricsPublisher, NodeMetrics
+from ..tracing import now
+from ..calibration_routine import CalibrationRoutine, detect_board
+from ..process_host import ProcessHost
 
 
 class Node:
+    # Nodes are driven by a Scheduler: step() runs whenever one of inputs() is
+    # written to, and must not block waiting for input.
     def __init__(self, name: str | None = None):
         if name is None:
             self.name = self.__class__.__name__
         else:
             self.name = f"{self.__class__.__name__}_{name}"
-        self._stop = False
-        self.thread = Thread(name=name, target=self._run)
 
-    def _run(self):
-        while True:
-            if self._stop:
-                break
+        # Assigned by Scheduler.add()
+        self.scheduler: Scheduler | None = None
+        self.started = time.perf_counter()
+        self.run_time = 0.0
+        self.logger = logging.getLogger(self.name)
+        self.metrics = NodeMetrics()
+
+    @property
+    def idle_time(self) -> float:
+        return time.perf_counter() - self.started - self.run_time
+
+    def inputs(self) -> list[Edge[Capture]]:
+        return [self.source]
+
+    def step(self) -> bool:
+        """Processes at most one input. Returns False when there was nothing to do."""
+        return False
+
+    def views(self) -> list[tuple[int, bool]]:
+        """The (scale, grayscale) images step() will read of the next capture"""
+        return []
+
+    def wake(self):
+        if self.scheduler is not None:
+            self.scheduler.wake(self)
+
+    def receive(self, source: Edge[Capture]) -> Capture:
+        capture = source.get_nowait()
+        capture.trace.enter(self.name)
+        self.metrics.input_age.record(now() - capture.trace.origin)
+        return capture
+
+    def complete(self, capture: Capture, skipped: bool = False):
+        service_time = capture.trace.exit(self.name)
+        if service_time is not None and not skipped:
+            self.metrics.service_time.record(service_time)
+
+    def send(
+        self,
+        sink: Edge[Capture] | Broadcast[Capture],
+        capture: Capture,
+        skipped: bool = False,
+    ):
+        self.complete(capture, skipped)
 
-            self.loop()
+        if sink.full():
+            self.metrics.dropped += 1
+        else:
+            sink.put(capture)
+            if skipped:
+                self.metrics.skipped += 1
+            else:
+                self.metrics.processed += 1
 
-    def loop(self):
+    def stop(self):
         pass
 
-    def stop(self):
-        self._stop = True
-        self.thread.join()
+
+class OffloadNode(Node):
+    # A node whose heavy part can run in a ProcessHost worker. Without a host it
+    # runs in place. With one, a capture waits in self.pending until its result
+    # comes back, which wakes the node to finish the capture and send it on.
+    # With a Decimator, frames it doesn't admit are forwarded unprocessed, including
+    # those arriving while a capture is pending. They carry the last measurements
+    # and are repainted with the last result, so the overlay doesn't flicker. Once
+    # such a frame has gone out, the pending capture is older than what's downstream,
+    # so its result is only kept for the frames that follow and it isn't sent.
+    # preview() says whether anyone will see what the node draws on the capture;
+    # when not, finish() only measures. Drawings are made at 1/preview_scale, the
+    # size the debug stream shows, so they don't force a full-size decode.
+    def __init__(
+        self,
+        name: str | None = None,
+        host: ProcessHost | None = None,
+        decimator: Decimator | None = None,
+        preview: Callable[[], bool] = lambda: True,
+        preview_scale: int = 1,
+    ):
+        self.host = host
+        self.decimator = decimator
+        self.preview = preview
+        self.preview_scale = preview_scale
+        self.pending: tuple[Capture, Any, Future, float] | None = None
+        # Whether newer frames were sent on while the pending capture was processed
+        self.overtaken = False
+        # What the last finish() added to the metadata, for the frames in between
+        self.measurements: dict[str, Any] = {}
+
+        super().__init__(name)
+
+    def submit(self, capture: Capture) -> tuple[Any, Future | None] | None:
+        """Starts the heavy part on the host, as (context, future), or None to run it
+        in place. The future is None when the host is too busy to take the frame."""
+        return None
+
+    def compute(self, capture: Capture) -> tuple[Any, Any]:
+        """The heavy part run in place, as (context, result)"""
+        return None, None
+
+    def finish(self, capture: Capture, context: Any, result: Any):
+        pass
+
+    def repaint(self, capture: Capture):
+        """Draws the last result on a capture that wasn't processed"""
+        pass
+
+    def views(self) -> list[tuple[int, bool]]:
+        return [(self.preview_scale, False)] if self.preview() else []
+
+    def processed(
+        self,
+        capture: Capture,
+        context: Any,
+        result: Any,
+        start: float,
+        stale: bool = False,
+    ):
+        if self.decimator is not None:
+            self.decimator.processed(now() - start)
+
+        before = set(capture.metadata)
+        self.finish(capture, context, result)
+        self.measurements = {
+            key: value for key, value in capture.metadata.items() if key not in before
+        }
+
+        if stale:
+            # Sending it would take the stream back in time
+            self.complete(capture)
+            self.metrics.processed += 1
+        else:
+            self.send(self.sink, capture)
+
+    def skip(self, capture: Capture):
+        if self.pending is not None:
+            self.overtaken = True
+        capture.metadata.update(self.measurements)
+        if self.preview():
+            self.repaint(capture)
+
+        self.send(self.sink, capture, skipped=True)
+
+    def admit(self, capture: Capture) -> bool:
+        late, over_budget = self.decimator.late, self.decimator.over_budget
+        admitted = self.decimator.admit(capture, busy=self.pending is not None)
+
+        # Nothing is processed while frames are late, so say so rather than go quiet
+        self.metrics.late += self.decimator.late - late
+        if self.decimator.over_budget and not over_budget:
+            self.logger.warning(
+                "Frames are older than the latency budget of "
+                f"{self.decimator.latency_budget * 1000:.0f} ms, skipping them"
+            )
+        elif over_budget and not self.decimator.over_budget:
+            self.logger.info("Frames are back within the latency budget")
+
+        return admitted
+
+    def step(self) -> bool:
+        if self.pending is not None and self.pending[2].done():
+            capture, context, future, start = self.pending
+            self.pending = None
+            try:
+                result = future.result()
+            except Exception:
+                self.logger.exception(f"{self.name} failed in a worker process")
+                result = None
+
+            self.processed(capture, context, result, start, stale=self.overtaken)
+            return True
+
+        if self.pending is not None and self.decimator is None:
+            return False
+
+        try:
+            capture = self.receive(self.source)
+        except Empty:
+            return False
+
+        if self.decimator is not None and not self.admit(capture):
+            self.skip(capture)
+            return True
+
+        start = now()
+        submitted = None if self.host is None else self.submit(capture)
+        if submitted is None:
+            context, result = self.compute(capture)
+            self.processed(capture, context, result, start)
+            return True
+
+        context, future = submitted
+        if future is None:
+            # The workers are behind, waiting for them would hold up the camera
+            self.skip(capture)
+            return True
+
+        self.pending = (capture, context, future, start)
+        self.overtaken = False
+        future.add_done_callback(lambda _: self.wake())
+        return True
 
 
 class Graph:
-    def __init__(self, name: str):
+    def __init__(self, name: str, scheduler: Scheduler, table: NetworkTable):
         self.nodes: list[Node] = []
         self.name = name
+        self.scheduler = scheduler
+        self.table = table
         self.logger = logging.getLogger(self.name)
 
-    def add_node(self, node: Node):
+        self.publisher = MetricsPublisher(table)
+        self.publish_period = 1.0
+        self._last_publish = 0.0
+
+    def add_node(self, node: Node, suspended: bool = False):
         self.nodes.append(node)
-        node.thread.start()
+        self.scheduler.add(node, suspended)
+
+    def periodic(self):
+        timestamp = time.perf_counter()
+        if timestamp - self._last_publish < self.publish_period:
+            return
+        self._last_publish = timestamp
+
+        self.publisher.publish(self.metrics())
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            node.name: {
+                **node.metrics.snapshot(),
+                "run_time": node.run_time,
+                "idle_time": node.idle_time,
+                "inputs": {
+                    str(i): {
+                        "queue_depth": edge.qsize(),
+                        "puts": edge.puts,
+                        # Frames replaced before this node got to them
+                        "overwritten": edge.overwrites,
+                    }
+                    for i, edge in enumerate(node.inputs())
+                },
+            }
+            for node in list(self.nodes)
+        }
 
     def stop(self):
         for node in self.nodes:
             self.logger.info(f"Stopping {node.name}...")
+            self.scheduler.remove(node)
             node.stop()
             self.logger.info(f"Stopped {node.name}.")
 
 
-class SelectSink(Node):
+# Builds one node of a branch from its input and output edges
+Stage = Callable[[Edge[Capture], Edge[Capture]], Node]
+
+
+class ModeGraph(Graph):
+    # A graph whose middle depends on a mode. Each mode is a chain of stages from
+    # the shared source to the shared sink, built once up front. Only the active
+    # mode's nodes are scheduled, the others are suspended and cost nothing, so
+    # switching modes is a matter of resuming a branch rather than rewiring.
     def __init__(
-        self, source: Queue, sink: dict[str, Queue], selector: Callable[[], str]
+        self,
+        name: str,
+        scheduler: Scheduler,
+        table: NetworkTable,
+        source: Edge[Capture],
+        sink: Edge[Capture],
     ):
+        super().__init__(name, scheduler, table)
+
         self.source = source
         self.sink = sink
-        self.selector = selector
+        self.modes: dict[str, list[Node]] = {}
+        self.branch_edges: dict[str, list[Edge[Capture]]] = {}
+        self.mode: str | None = None
 
-        super().__init__()
+    def add_mode(self, mode: str, *stages: Stage) -> list[Node]:
+        edges = [self.source]
+        edges += [Mailbox() for _ in range(len(stages) - 1)]
+        edges.append(self.sink)
 
-    def loop(self):
-        try:
-            sink = self.sink[self.selector()]
-            if sink is None:
-                return
+        nodes = [stage(edges[i], edges[i + 1]) for i, stage in enumerate(stages)]
 
-            capture = self.source.get(timeout=0.1)
+        self.modes[mode] = nodes
+        self.branch_edges[mode] = edges[1:-1]
 
-            if not sink.full():
-                sink.put(capture)
+        for node in nodes:
+            self.add_node(node, suspended=mode != self.mode)
 
-        except Empty:
-            pass
+        return nodes
 
+    def activate(self, mode: str):
+        if mode == self.mode:
+            return
 
-class SelectSource(Node):
-    def __init__(
-        self, source: dict[str, Queue], sink: Queue, selector: Callable[[], str]
-    ):
-        self.source = source
-        self.sink = sink
-        self.selector = selector
+        self.logger.info(f"Switching from {self.mode} to {mode}")
 
-        super().__init__()
+        if self.mode is not None:
+            for node in self.modes[self.mode]:
+                self.scheduler.suspend(node)
 
-    def loop(self):
-        try:
-            source = self.source[self.selector()]
-            if source is None:
-                return
+            # Don't hand frames of the old mode to it the next time it's resumed
+            for edge in self.branch_edges[self.mode]:
+                edge.clear()
 
-            capture = source.get(timeout=0.1)
+        self.mode = mode
 
-            if not self.sink.full():
-                self.sink.put(capture)
+        for node in self.modes[mode]:
+            self.scheduler.resume(node)
 
-        except Empty:
-            pass
+    def views(self) -> set[tuple[int, bool]]:
+        """What the nodes of the active mode and those outside any mode will read"""
+        suspended = {
+            node
+            for mode, nodes in self.modes.items()
+            if mode != self.mode
+            for node in nodes
+        }
+        return {
+            view
+            for node in self.nodes
+            if node not in suspended
+            for view in node.views()
+        }
 
 
 class FpsNode(Node):
     # Measures the FPS of the last action to occur in the processing graph
-    def __init__(self, source: Queue, sink: Queue, name=None):
+    def __init__(self, source: Edge, sink: Edge, name=None):
         self.source = source
         self.sink = sink
         self.fps = FpsCounter()
 
         super().__init__(name)
 
-    def loop(self):
+    def step(self) -> bool:
         try:
-            capture = self.source.get(timeout=0.1)
+            capture = self.receive(self.source)
 
             capture.metadata[self.name] = self.fps.getfps()
 
-            if not self.sink.full():
-                self.sink.put(capture)
+            self.send(self.sink, capture)
+
+            return True
 
         except Empty:
-            pass
+            return False
 
 
 @dataclass
@@ -161,28 +416,57 @@ class CalibrationConfig:
         )
 
 
-class DetectCharucoNode(Node):
-    def __init__(self, source: Queue[Capture], sink: Queue, name: str):
+class DetectCharucoNode(OffloadNode):
+    def __init__(
+        self,
+        source: Edge[Capture],
+        sink: Edge,
+        name: str,
+        host: ProcessHost | None = None,
+        decimator: Decimator | None = None,
+        preview: Callable[[], bool] = lambda: True,
+        preview_scale: int = 1,
+    ):
         self.source = source
         self.sink = sink
         self.routine: CalibrationRoutine | None = None
+        # Markers of the last detection, drawn again on the frames in between
+        self.markers = None
 
-        super().__init__(name)
+        super().__init__(name, host, decimator, preview, preview_scale)
 
-    def loop(self):
-        try:
-            capture = self.source.get(timeout=0.1)
+    def submit(self, capture: Capture) -> tuple[Any, Future | None] | None:
+        routine = self.routine
+        if routine is None:
+            return None
 
-            if self.routine is not None:
-                self.routine.run(capture)
+        return routine, self.host.submit(detect_board, capture.gray, routine.config)
 
-            if not self.sink.full():
-                self.sink.put(capture)
+    def compute(self, capture: Capture) -> tuple[Any, Any]:
+        routine = self.routine
+        if routine is None:
+            return None, None
 
-        except Empty:
-            pass
+        return routine, routine.detect(capture)
+
+    def views(self) -> list[tuple[int, bool]]:
+        if self.routine is None:
+            return super().views()
+
+        return [(1, True), *super().views()]
+
+    def finish(self, capture: Capture, routine: Any, detection: Any):
+        if routine is not None and detection is not None:
+            routine.apply(capture, detection, self.preview(), self.preview_scale)
+            self.markers = detection[2]
+
+    def repaint(self, capture: Capture):
+        routine = self.routine
+        if routine is not None and (routine.corner_cache or self.markers is not None):
+            routine.paint(capture, self.markers, self.preview_scale)
 
     def begin_calibration(self, routine: CalibrationRoutine):
+        self.markers = None
         self.routine = routine
 
     def end_calibration(self) -> CalibrationRoutine | None:
@@ -0,0 +1,63 @@
+from . import Node
+from .edge import Edge
+from ntcore import NetworkTable
+from queue import Empty
+from robotpy_apriltag import AprilTagDetection, AprilTagDetector
+
+import numpy as np
+from ..datatypes import Capture
+
+
+class AprilTagNode(Node):
+    # Finds AprilTags and publishes them to NetworkTables. It reads its own tap of
+    # the decoded frames, next to the mode graph, so tags are found on the same
+    # frames focus scoring and the debug stream are working on. It only reads the
+    # grayscale image and never draws, so it copies nothing.
+    def __init__(
+        self,
+        source: Edge[Capture],
+        table: NetworkTable,
+        name: str,
+        family: str = "tag36h11",
+    ):
+        self.source = source
+
+        self.detector = AprilTagDetector()
+        if not self.detector.addFamily(family):
+            raise ValueError(f"Unknown AprilTag family {family}")
+
+        self.timestamp_pub = table.getDoubleTopic("timestamp").publish()
+        self.ids_pub = table.getIntegerArrayTopic("ids").publish()
+        # x, y of each tag's center, in full-resolution pixels
+        self.centers_pub = table.getDoubleArrayTopic("centers").publish()
+
+        super().__init__(name)
+
+    def detect(self, capture: Capture) -> list[AprilTagDetection]:
+        # The detector wants a contiguous image, YUYV luma is a strided view
+        return self.detector.detect(np.ascontiguousarray(capture.gray))
+
+    def views(self) -> list[tuple[int, bool]]:
+        return [(1, True)]
+
+    def step(self) -> bool:
+        try:
+            capture = self.receive(self.source)
+        except Empty:
+            return False
+
+        detections = self.detect(capture)
+
+        self.timestamp_pub.set(capture.frame.timestamp)
+        self.ids_pub.set([detection.getId() for detection in detections])
+        self.centers_pub.set(
+            [
+                value
+                for detection in detections
+                for value in (detection.getCenter().x, detection.getCenter().y)
+            ]
+        )
+
+        self.complete(capture)
+        self.metrics.processed += 1
+        return True
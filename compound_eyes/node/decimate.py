@@ -0,0 +1,73 @@
+from ..datatypes import Capture
+from ..tracing import now
+
+import math
+
+
+class Decimator:
+    # Picks the frames a heavy node processes; the node forwards the rest unprocessed
+    # so everything behind it keeps the camera's frame rate. Frames are taken every
+    # Nth, N following the measured input rate, so the processed ones are evenly
+    # spaced instead of bursty. N never drops below what the node's own service
+    # time allows, and frames older than the latency budget are never processed.
+    def __init__(
+        self, target_rate: float | None = None, latency_budget: float | None = None
+    ):
+        self.target_rate = target_rate
+        self.latency_budget = latency_budget
+
+        self.interval = 0.0
+        self.service_time = 0.0
+        self.every = 1
+        # Frames refused for being older than the latency budget, and whether the
+        # last frame that could have been processed was
+        self.late = 0
+        self.over_budget = False
+        self._skipped = 0
+        self._last_arrival: float | None = None
+
+    @staticmethod
+    def _average(average: float, value: float) -> float:
+        # Exponential moving average, like FpsCounter
+        alpha = 0.2
+        return value if average == 0 else (1 - alpha) * average + alpha * value
+
+    def _update_every(self):
+        if self.interval == 0:
+            self.every = 1
+            return
+
+        every = 1.0
+        if self.target_rate:
+            every = max(every, round(1 / (self.target_rate * self.interval)))
+        # Taking frames faster than they can be processed only makes them wait
+        every = max(every, math.ceil(self.service_time / self.interval - 0.05))
+        self.every = int(every)
+
+    def admit(self, capture: Capture, busy: bool = False) -> bool:
+        timestamp = now()
+        if self._last_arrival is not None:
+            self.interval = self._average(self.interval, timestamp - self._last_arrival)
+        self._last_arrival = timestamp
+
+        if busy:
+            return False
+
+        self.over_budget = (
+            self.latency_budget is not None
+            and timestamp - capture.trace.origin > self.latency_budget
+        )
+        if self.over_budget:
+            self.late += 1
+            return False
+
+        self._update_every()
+        if self._skipped < self.every - 1:
+            self._skipped += 1
+            return False
+
+        self._skipped = 0
+        return True
+
+    def processed(self, service_time: float):
+        self.service_time = self._average(self.service_time, service_time)
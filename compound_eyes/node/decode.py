@@ -0,0 +1,110 @@
+from . import Node
+from collections import deque
+from .edge import Broadcast, Edge
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty
+from ntcore import NetworkTable
+from typing import Callable, Iterable
+
+import time
+from ..datatypes import FULL, Capture
+
+
+class DecodeNode(Node):
+    # Decodes captures on a thread pool. OpenCV releases the GIL while decoding, so
+    # several frames can be in flight at once. Captures are delivered in the order
+    # they arrived, which is V4L2 sequence order. Only the images demand() says the
+    # nodes downstream will read are decoded ahead of them; a frame nobody will look
+    # at is passed on raw, in order, without going through the pool.
+    def __init__(
+        self,
+        source: Edge[Capture],
+        sink: Edge[Capture] | Broadcast[Capture],
+        name: str,
+        workers: int,
+        table: NetworkTable,
+        demand: Callable[[], Iterable[tuple[int, bool]]] = lambda: [FULL],
+    ):
+        self.source = source
+        self.sink = sink
+        self.workers = workers
+        self.demand = demand
+        self.executor = (
+            ThreadPoolExecutor(workers, thread_name_prefix=f"decode_{name}")
+            if workers > 0
+            else None
+        )
+        self.pending: deque[tuple[Capture, Future[float | None]]] = deque()
+        self.max_pending = workers * 2
+
+        self.latency = 0.0
+        self.latency_pub = table.getDoubleTopic("latency_ms").publish()
+        self.queue_depth_pub = table.getIntegerTopic("queue_depth").publish()
+        self.workers_pub = table.getIntegerTopic("workers").publish()
+        self.workers_pub.set(workers)
+
+        super().__init__(name)
+
+    @staticmethod
+    def decode(
+        capture: Capture, views: list[tuple[int, bool]], submitted: float
+    ) -> float:
+        for scale, grayscale in views:
+            capture.reduced(scale, grayscale)
+        return time.perf_counter() - submitted
+
+    def step(self) -> bool:
+        if self.executor is None:
+            # Decoding is left to whichever node first needs the pixels
+            try:
+                capture = self.receive(self.source)
+
+                self.send(self.sink, capture)
+
+                return True
+
+            except Empty:
+                return False
+
+        busy = False
+        if len(self.pending) < self.max_pending:
+            try:
+                capture = self.receive(self.source)
+                views = list(self.demand())
+                if len(views) != 0:
+                    future = self.executor.submit(
+                        self.decode, capture, views, time.perf_counter()
+                    )
+                    # Deliver from the scheduler once decoding is done, not by
+                    # waiting on it
+                    future.add_done_callback(lambda _: self.wake())
+                else:
+                    # Still queued, so it doesn't overtake frames being decoded
+                    future = Future()
+                    future.set_result(None)
+                self.pending.append((capture, future))
+                busy = True
+            except Empty:
+                pass
+
+        self.queue_depth_pub.set(len(self.pending))
+
+        while self.pending and self.pending[0][1].done():
+            capture, future = self.pending.popleft()
+
+            latency = future.result()
+            if latency is not None:
+                # Exponential moving average, like FpsCounter
+                alpha = 0.2
+                self.latency = (1 - alpha) * self.latency + alpha * latency * 1000
+                self.latency_pub.set(self.latency)
+
+            self.send(self.sink, capture)
+            busy = True
+
+        return busy
+
+    def stop(self):
+        super().stop()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
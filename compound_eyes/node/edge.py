@@ -0,0 +1,136 @@
+from queue import Empty, Queue
+from threading import Condition, Lock
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class Edge(Queue, Generic[T]):
+    # A Queue that wakes the nodes reading from it whenever something is put on it
+    def __init__(self, maxsize: int = 1):
+        super().__init__(maxsize)
+        self._listeners: list[Callable[[], None]] = []
+        self.puts = 0
+        # A full queue keeps the old item, so there is nothing to overwrite
+        self.overwrites = 0
+
+    def subscribe(self, listener: Callable[[], None]):
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def subscribed(self) -> bool:
+        """Whether a node reads from this edge"""
+        return len(self._listeners) > 0
+
+    def put(self, item: T, block: bool = True, timeout: float | None = None):
+        super().put(item, block, timeout)
+        self.puts += 1
+
+        for listener in list(self._listeners):
+            listener()
+
+
+class Mailbox(Edge[T]):
+    # Holds only the latest item. A put replaces whatever the consumer has not
+    # taken yet, so a lagging consumer always gets the newest frame instead of a
+    # stale one. Never full, so producers never drop what they just made.
+    def __init__(self):
+        super().__init__(1)
+        self._item: T | None = None
+        self._has_item = False
+        self._condition = Condition()
+
+    def put(self, item: T, block: bool = True, timeout: float | None = None):
+        with self._condition:
+            self.puts += 1
+            if self._has_item:
+                self.overwrites += 1
+            self._item = item
+            self._has_item = True
+            self._condition.notify()
+
+        for listener in list(self._listeners):
+            listener()
+
+    def put_nowait(self, item: T):
+        self.put(item)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> T:
+        with self._condition:
+            if block and not self._condition.wait_for(
+                lambda: self._has_item, timeout
+            ):
+                raise Empty
+            if not self._has_item:
+                raise Empty
+
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def get_nowait(self) -> T:
+        return self.get(block=False)
+
+    def clear(self):
+        with self._condition:
+            self._item = None
+            self._has_item = False
+
+    def qsize(self) -> int:
+        return int(self._has_item)
+
+    def empty(self) -> bool:
+        return not self._has_item
+
+    def full(self) -> bool:
+        return False
+
+
+class Broadcast(Generic[T]):
+    # Fans one producer out to any number of consumers, each reading its own
+    # Mailbox tap. Every consumer gets its own Capture of the same frame from
+    # Capture.copy(), which shares the pixels: nothing is copied unless a consumer
+    # draws, and then only that consumer's overlay is. A slow consumer only drops
+    # frames from its own tap.
+    def __init__(self):
+        self.taps: dict[str, Mailbox[T]] = {}
+        self._lock = Lock()
+
+    def tap(self, name: str) -> Mailbox[T]:
+        with self._lock:
+            if name in self.taps:
+                raise ValueError(f"{name} is already tapped")
+
+            tap = Mailbox()
+            self.taps[name] = tap
+            return tap
+
+    def untap(self, name: str):
+        with self._lock:
+            self.taps.pop(name, None)
+
+    def put(self, item: T, block: bool = True, timeout: float | None = None):
+        with self._lock:
+            taps = list(self.taps.values())
+
+        if len(taps) == 0:
+            return
+
+        # Copy before any consumer can see the original and start drawing on it
+        items = [item] + [item.copy() for _ in taps[1:]]
+        for tap, item in zip(taps, items):
+            tap.put(item)
+
+    def put_nowait(self, item: T):
+        self.put(item)
+
+    def full(self) -> bool:
+        return False
+
+    def drops(self) -> dict[str, int]:
+        with self._lock:
+            return {name: tap.overwrites for name, tap in self.taps.items()}
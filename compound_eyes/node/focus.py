@@ -1,8 +1,12 @@
-from . import Node
-from queue import Queue, Empty
+from . import OffloadNode
+from .decimate import Decimator
+from .edge import Edge
+from concurrent.futures import Future
+from typing import Any, Callable
 
 import cv2
 from ..datatypes import Capture
+from ..process_host import ProcessHost
 import numpy
 from scipy.ndimage import convolve
 
@@ -18,28 +22,44 @@ def modified_laplacian(frame):
     return FM.mean()
 
 
-class FocusNode(Node):
-    def __init__(self, source: Queue[Capture], sink: Queue, name: str):
+def focus_metric(frame: cv2.typing.MatLike, roi: tuple[float, float]) -> float:
+    roi_width = int(frame.shape[1] * roi[1])
+    roi_height = int(frame.shape[0] * roi[0])
+    roi_x = (frame.shape[1] - roi_width) // 2
+    roi_y = (frame.shape[0] - roi_height) // 2
+
+    return modified_laplacian(
+        frame[roi_y : roi_y + roi_height, roi_x : roi_x + roi_width]
+    )
+
+
+class FocusNode(OffloadNode):
+    def __init__(
+        self,
+        source: Edge[Capture],
+        sink: Edge,
+        name: str,
+        host: ProcessHost | None = None,
+        decimator: Decimator | None = None,
+        preview: Callable[[], bool] = lambda: True,
+        preview_scale: int = 1,
+    ):
         self.source = source
         self.sink = sink
 
         self.history: list[tuple[float, float]] = []
         self.history_length = 10
         self.roi = (0.5, 0.5)
+        # The focus metric is relative, so it can be computed on a smaller decode
+        self.scale = 2
 
-        super().__init__(name)
+        super().__init__(name, host, decimator, preview, preview_scale)
 
     def measure(self, timestamp: float, frame: cv2.typing.MatLike):
-        roi_width = int(frame.shape[1] * self.roi[1])
-        roi_height = int(frame.shape[0] * self.roi[0])
-        roi_x = (frame.shape[1] - roi_width) // 2
-        roi_y = (frame.shape[0] - roi_height) // 2
-
-        roi = frame[roi_y : roi_y + roi_height, roi_x : roi_x + roi_width]
+        return self.record(timestamp, focus_metric(frame, self.roi))
 
-        focus_metric = modified_laplacian(roi)
-
-        self.history.append((timestamp, focus_metric))
+    def record(self, timestamp: float, metric: float):
+        self.history.append((timestamp, metric))
 
         while (
             len(self.history) != 0
@@ -47,7 +67,7 @@ class FocusNode(Node):
         ):
             self.history.pop(0)
 
-        return focus_metric / max(self.history, key=lambda x: x[1])[1]
+        return metric / max(self.history, key=lambda x: x[1])[1]
 
     def paint(self, frame: cv2.typing.MatLike):
         graph_height = frame.shape[0] // 2
@@ -113,20 +133,30 @@ class FocusNode(Node):
                 2,
             )
 
-    def loop(self):
-        try:
-            capture = self.source.get(timeout=0.1)
+    def submit(self, capture: Capture) -> tuple[Any, Future | None] | None:
+        greyscale = capture.reduced(self.scale, grayscale=True)
+
+        return None, self.host.submit(focus_metric, greyscale, self.roi)
+
+    def compute(self, capture: Capture) -> tuple[Any, Any]:
+        greyscale = capture.reduced(self.scale, grayscale=True)
+
+        return None, focus_metric(greyscale, self.roi)
 
-            greyscale = cv2.cvtColor(capture.image, cv2.COLOR_BGR2GRAY)
+    def views(self) -> list[tuple[int, bool]]:
+        return [(self.scale, True), *super().views()]
 
-            percent_focus = self.measure(capture.frame.timestamp, greyscale)
+    def finish(self, capture: Capture, context: Any, metric: Any):
+        if metric is None:
+            return
 
-            self.paint(capture.image)
+        percent_focus = self.record(capture.frame.timestamp, metric)
 
-            capture.metadata["percent_focus"] = percent_focus
+        if self.preview():
+            self.paint(capture.writable(self.preview_scale))
 
-            if not self.sink.full():
-                self.sink.put(capture)
+        capture.metadata["percent_focus"] = percent_focus
 
-        except Empty:
-            pass
+    def repaint(self, capture: Capture):
+        if len(self.history) != 0:
+            self.paint(capture.writable(self.preview_scale))
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from threading import Condition
+from typing import TYPE_CHECKING
+
+import logging
+import os
+import time
+
+if TYPE_CHECKING:
+    from . import Node
+
+
+class NodeState(Enum):
+    IDLE = 0
+    SCHEDULED = 1
+    RUNNING = 2
+    # Woken while running, so it has to run again
+    RERUN = 3
+
+
+class Scheduler:
+    # Runs nodes on one bounded worker pool shared by every camera. A node only runs
+    # when one of its input edges is written to (or it wakes itself), and never on
+    # two workers at once.
+    logger = logging.getLogger("Scheduler")
+
+    def __init__(self, workers: int | None = None, batch: int = 4):
+        self.workers = workers or os.cpu_count() or 1
+        # Steps a node may take before giving its worker back
+        self.batch = batch
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="node")
+        self._states: dict[Node, NodeState] = {}
+        # Nodes that stay registered but are never run, like inactive mode branches
+        self._suspended: set[Node] = set()
+        self._condition = Condition()
+
+    def add(self, node: Node, suspended: bool = False):
+        with self._condition:
+            self._states[node] = NodeState.IDLE
+        node.scheduler = self
+        node.started = time.perf_counter()
+
+        if suspended:
+            with self._condition:
+                self._suspended.add(node)
+        else:
+            self.resume(node)
+
+    def suspend(self, node: Node):
+        # Doesn't wait for a step in progress, that step is the node's last
+        for edge in node.inputs():
+            edge.unsubscribe(node.wake)
+
+        with self._condition:
+            self._suspended.add(node)
+
+    def resume(self, node: Node):
+        with self._condition:
+            self._suspended.discard(node)
+
+        for edge in node.inputs():
+            edge.subscribe(node.wake)
+
+        # Pick up anything that was written while the node wasn't listening
+        self.wake(node)
+
+    def remove(self, node: Node):
+        for edge in node.inputs():
+            edge.unsubscribe(node.wake)
+
+        with self._condition:
+            # Only the step in progress has to finish, nothing is polling
+            self._condition.wait_for(
+                lambda: self._states.get(node) != NodeState.RUNNING
+                and self._states.get(node) != NodeState.RERUN
+            )
+            self._states.pop(node, None)
+            self._suspended.discard(node)
+
+    def wake(self, node: Node):
+        with self._condition:
+            if node in self._suspended:
+                return
+
+            state = self._states.get(node)
+            if state == NodeState.IDLE:
+                self._states[node] = NodeState.SCHEDULED
+                self.executor.submit(self._run, node)
+            elif state == NodeState.RUNNING:
+                self._states[node] = NodeState.RERUN
+
+    def _run(self, node: Node):
+        with self._condition:
+            if self._states.get(node) != NodeState.SCHEDULED:
+                return
+            self._states[node] = NodeState.RUNNING
+
+        busy = False
+        start = time.perf_counter()
+        try:
+            for _ in range(self.batch):
+                if node in self._suspended or not node.step():
+                    break
+            else:
+                busy = True
+        except Exception:
+            self.logger.exception(f"{node.name} failed")
+        finally:
+            node.run_time += time.perf_counter() - start
+
+        with self._condition:
+            if node in self._suspended:
+                self._states[node] = NodeState.IDLE
+            elif self._states.get(node) == NodeState.RERUN or (
+                busy and node in self._states
+            ):
+                self._states[node] = NodeState.SCHEDULED
+                self.executor.submit(self._run, node)
+            elif node in self._states:
+                self._states[node] = NodeState.IDLE
+
+            self._condition.notify_all()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,13 +1,18 @@
+import numbers
 import socket
 
 from . import Node
-from queue import Queue, Empty
-from mjpeg_streamer.server import Server
+from .edge import Edge
+from queue import Empty
 from mjpeg_streamer.stream import Stream
+from ntcore import NetworkTable
 from ..camera_server import PublishedCameraStream
-from typing import Any
+from ..debug_server import DebugServer
+from typing import Any, Callable
 from ..datatypes import Capture
+from ..tracing import LatencyTracker
 import cv2
+import numpy as np
 
 
 def get_ip():
@@ -28,35 +33,129 @@ class DebugNode(Node):
     def __init__(
         self,
         name: str,
-        port: int,
-        source: Queue[Capture],
+        server: DebugServer,
+        source: Edge[Capture],
+        overlay: Callable[[], bool] = lambda: True,
+        scale: int = 1,
+        latency: LatencyTracker | None = None,
+        metrics: Callable[[], dict[str, Any]] | None = None,
+        table: NetworkTable | None = None,
     ):
         self.source = source
+        self.overlay = overlay
+        self.scale = scale
+        self.latency = latency
+
+        # What upstream nodes measured, by metadata key, as (publisher, type)
+        self.table = table
+        self.publishers: dict[str, tuple[Any, type]] = {}
 
         self.stream = Stream(name, fps=30)
-        self.server = Server(self.stream, "0.0.0.0", port)
-        self.server.start()
+        # Served by the shared server under the camera's name, so the URL stays
+        # the same when the camera is unplugged and comes back
+        self.server = server
+        self.registration = self.server.register(name, self.stream, metrics)
 
+        # Published once the first frame shows what size the stream really is
         self.registered_stream = PublishedCameraStream(name)
-        self.registered_stream.enable(
-            "",
-            "1600x1304 MJPG 30 fps",
-            [f"mjpg:http://{get_ip()}:{port}/stream.mjpg"],
-        )
+        self.url = f"mjpg:http://{get_ip()}:{self.server.port}{self.registration.path}"
+        self.output_size: tuple[int, int] | None = None
+        # Whether the last frame went to the stream as the camera's own JPEG
+        self.passthrough = False
 
         super().__init__(name)
 
-    def loop(self):
+    def step(self) -> bool:
         try:
-            capture = self.source.get(timeout=0.1)
-            image = capture.image.copy()
+            capture = self.receive(self.source)
+
+            # Measurements reach NetworkTables whether or not anyone is watching
+            self.publish(capture.metadata)
+
+            passthrough = not self.overlay() and capture.jpeg is not None
+            self.advertise(capture, passthrough)
+            self.passthrough = passthrough
+
+            image = None
+            if not self.stream.has_demand():
+                # Nobody is watching, so no copy, overlay or encode
+                pass
+            elif passthrough:
+                # Nothing to draw, hand the camera's JPEG straight to the stream
+                image = capture.jpeg
+            else:
+                image = capture.writable(self.scale)
 
-            self.paint_frame(image, capture.frame.timestamp, capture.metadata)
+                self.paint_frame(image, capture.frame.timestamp, capture.metadata)
 
-            self.stream.set_frame(image)
+            self.complete(capture)
+            self.metrics.processed += 1
+            if image is not None:
+                # Encoded off this thread; the stream adds encode and write spans to the trace later
+                self.stream.set_frame(image, capture.trace)
+
+            if self.latency is not None:
+                self.latency.record(capture.trace)
+
+            return True
 
         except Empty:
-            pass
+            return False
+
+    def advertise(self, capture: Capture, passthrough: bool):
+        width, height = capture.frame.format.width, capture.frame.format.height
+        if not passthrough:
+            width, height = width // self.scale, height // self.scale
+
+        if self.output_size != (width, height):
+            self.output_size = (width, height)
+            self.registered_stream.enable(
+                "", f"{width}x{height} MJPG {self.stream.fps} fps", [self.url]
+            )
+
+    def views(self) -> list[tuple[int, bool]]:
+        if not self.stream.has_demand() or self.passthrough:
+            return []
+
+        return [(self.scale, False)]
+
+    def preview(self) -> bool:
+        """Whether overlays drawn upstream will be seen"""
+        return self.stream.has_demand() and self.overlay()
+
+    def publish(self, metadata: dict[str, Any]):
+        if self.table is None:
+            return
+
+        for key, value in metadata.items():
+            entry = self.publishers.get(key)
+            if entry is None:
+                entry = self.publisher(key, value)
+                if entry is None:
+                    continue
+                self.publishers[key] = entry
+
+            publisher, kind = entry
+            try:
+                publisher.set(kind(value))
+            except (TypeError, ValueError):
+                # Only numbers are published, and a topic keeps its first type
+                pass
+
+    def publisher(self, key: str, value: Any) -> tuple[Any, type] | None:
+        """A publisher of the topic type that fits the value, None if it isn't a number"""
+        if isinstance(value, (bool, np.bool_)):
+            return self.table.getBooleanTopic(key).publish(), bool
+        if isinstance(value, numbers.Integral):
+            return self.table.getIntegerTopic(key).publish(), int
+        if isinstance(value, numbers.Real):
+            return self.table.getDoubleTopic(key).publish(), float
+
+        return None
+
+    def stop(self):
+        self.server.unregister(self.registration)
+        self.registered_stream.disable()
 
     def paint_frame(
         self, image: cv2.typing.MatLike, timestamp: float, metadata: dict[str, Any]
@@ -73,9 +172,10 @@ class DebugNode(Node):
 
         height = 60
         for key, value in metadata.items():
+            text = f"{value:.2f}" if isinstance(value, float) else f"{value}"
             cv2.putText(
                 image,
-                f"{key}: {value:.2f}",
+                f"{key}: {text}",
                 (10, height),
                 cv2.FONT_HERSHEY_SIMPLEX,
                 1,
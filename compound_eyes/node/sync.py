@@ -0,0 +1,168 @@
+from . import Node
+from .edge import Edge
+from collections import deque
+from dataclasses import dataclass
+from ntcore import NetworkTable
+from queue import Empty
+from threading import Lock
+from typing import Any
+
+from ..datatypes import Capture
+from ..metrics import Histogram, MetricsPublisher
+from ..tracing import now
+
+
+@dataclass
+class Bundle:
+    # Captures of the same moment from several cameras, keyed by camera
+    timestamp: float
+    captures: dict[str, Capture]
+    # Spread of the V4L2 timestamps in the bundle, in seconds
+    skew: float
+
+
+class FrameSynchronizer:
+    # Matches captures from several cameras by V4L2 timestamp. Each camera has a
+    # short buffer; whenever every camera has a capture waiting, the oldest ones
+    # are compared. Within the tolerance they make a bundle. Otherwise the oldest
+    # capture can never be matched, since everything else is already newer, and
+    # is dropped. Buffered items can be anything, or None when only the
+    # timestamps matter.
+    def __init__(self, tolerance: float = 0.005, buffer: int = 4):
+        self.tolerance = tolerance
+        self.buffer = buffer
+        self.buffers: dict[str, deque[tuple[float, Any]]] = {}
+
+        self.bundles = 0
+        self.dropped: dict[str, int] = {}
+        self.skew = Histogram()
+
+    def add_camera(self, name: str):
+        self.buffers[name] = deque()
+        self.dropped.setdefault(name, 0)
+
+    def remove_camera(self, name: str):
+        self.buffers.pop(name, None)
+        if len(self.buffers) < 2:
+            # Nothing left to match the rest against
+            for buffer in self.buffers.values():
+                buffer.clear()
+
+    def add(self, name: str, timestamp: float, item: Any = None) -> list[Bundle]:
+        if len(self.buffers) < 2:
+            # A single camera can't be matched, so don't hold on to its frames
+            return []
+
+        buffer = self.buffers[name]
+        if len(buffer) == self.buffer:
+            buffer.popleft()
+            self.dropped[name] += 1
+        buffer.append((timestamp, item))
+
+        return self.match()
+
+    def match(self) -> list[Bundle]:
+        bundles = []
+        while len(self.buffers) > 1 and all(self.buffers.values()):
+            heads = {name: buffer[0] for name, buffer in self.buffers.items()}
+            timestamps = {name: head[0] for name, head in heads.items()}
+            oldest = min(timestamps, key=timestamps.get)
+            skew = max(timestamps.values()) - timestamps[oldest]
+
+            if skew > self.tolerance:
+                self.buffers[oldest].popleft()
+                self.dropped[oldest] += 1
+                continue
+
+            for buffer in self.buffers.values():
+                buffer.popleft()
+
+            self.bundles += 1
+            self.skew.record(skew)
+            bundles.append(
+                Bundle(
+                    sum(timestamps.values()) / len(timestamps),
+                    {name: head[1] for name, head in heads.items()},
+                    skew,
+                )
+            )
+
+        return bundles
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "bundles": self.bundles,
+            "dropped": dict(self.dropped),
+            "skew": self.skew.snapshot(),
+        }
+
+
+class SyncNode(Node):
+    # Bundles frames from every camera it's attached to. Cameras come and go with
+    # the camera manager, so inputs are attached at runtime rather than up front.
+    # Buffered captures keep their frames' pixels alive, so captures are only
+    # buffered while a node is subscribed to the sink; otherwise only timestamps
+    # are matched, for the stats.
+    def __init__(
+        self,
+        sink: Edge[Bundle],
+        table: NetworkTable,
+        tolerance: float = 0.005,
+        buffer: int = 4,
+    ):
+        self.sink = sink
+        self.sources: dict[str, Edge[Capture]] = {}
+        self.synchronizer = FrameSynchronizer(tolerance, buffer)
+        # Cameras are attached from the camera manager while the node runs
+        self._lock = Lock()
+
+        self.publisher = MetricsPublisher(table)
+        self.publish_period = 1.0
+        self._last_publish = 0.0
+
+        super().__init__()
+
+    def inputs(self) -> list[Edge[Capture]]:
+        with self._lock:
+            return list(self.sources.values())
+
+    def attach(self, name: str, source: Edge[Capture]):
+        with self._lock:
+            self.synchronizer.add_camera(name)
+            self.sources[name] = source
+        source.subscribe(self.wake)
+
+    def detach(self, name: str):
+        with self._lock:
+            source = self.sources.pop(name, None)
+            self.synchronizer.remove_camera(name)
+        if source is not None:
+            source.unsubscribe(self.wake)
+
+    def step(self) -> bool:
+        busy = False
+        with self._lock:
+            consumed = self.sink.subscribed()
+            for name, source in self.sources.items():
+                try:
+                    capture = self.receive(source)
+                except Empty:
+                    continue
+
+                busy = True
+                bundles = self.synchronizer.add(
+                    name, capture.frame.timestamp, capture if consumed else None
+                )
+                self.complete(capture)
+
+                if consumed:
+                    for bundle in bundles:
+                        self.sink.put(bundle)
+                        self.metrics.processed += 1
+
+            timestamp = now()
+            if timestamp - self._last_publish >= self.publish_period:
+                self._last_publish = timestamp
+                self.publisher.publish(self.synchronizer.stats())
+
+        return busy
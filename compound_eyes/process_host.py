@@ -0,0 +1,189 @@
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from threading import Lock, Thread
+from typing import Any, Callable
+
+import itertools
+import logging
+import multiprocessing as mp
+import numpy as np
+import sys
+import traceback
+
+
+class FrameSlot:
+    # One image-sized block of shared memory, grown when a bigger image comes along
+    def __init__(self, index: int):
+        self.index = index
+        self.shm: shared_memory.SharedMemory | None = None
+
+    def write(self, image: np.ndarray) -> str:
+        if self.shm is None or self.shm.size < image.nbytes:
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+
+        # Strided views, like the luma plane of a YUYV frame, are packed on the way in
+        view = np.ndarray(image.shape, image.dtype, self.shm.buf)
+        np.copyto(view, image)
+        return self.shm.name
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    # Memory attached by name belongs to the parent, which unlinks it, so the
+    # worker must not register it with the resource tracker
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Before 3.13 attaching always registers. Unregistering afterwards isn't an
+    # option: spawned workers share the parent's tracker, which keeps a set of
+    # names, so it would drop the parent's own registration. Workers never create
+    # shared memory, so registration is simply skipped while attaching.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class _Attached:
+    # The worker side of the slots, attached by name and reattached when a slot grows
+    def __init__(self):
+        self.slots: dict[int, shared_memory.SharedMemory] = {}
+
+    def view(self, index: int, name: str, shape, dtype) -> np.ndarray:
+        shm = self.slots.get(index)
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()
+            shm = attach(name)
+            self.slots[index] = shm
+
+        return np.ndarray(shape, dtype, shm.buf)
+
+    def close(self):
+        for shm in self.slots.values():
+            shm.close()
+
+
+def _worker(requests: mp.Queue, results: mp.Queue):
+    attached = _Attached()
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+
+            job, kernel, index, name, shape, dtype, args = request
+            try:
+                image = attached.view(index, name, shape, dtype)
+                results.put((job, kernel(image, *args), None))
+            except Exception:
+                results.put((job, None, traceback.format_exc()))
+            finally:
+                image = None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        attached.close()
+
+
+class ProcessHost:
+    # Runs GIL-bound kernels, like focus scoring and Charuco detection, in worker
+    # processes shared by every camera. Images go through a ring of shared memory
+    # slots, only the slot's name and the kernel's small arguments and result are
+    # pickled. Kernels have to be module level functions taking the image first.
+    # When every slot is taken the workers are behind, and submit() refuses the
+    # frame rather than hold up the node that offered it.
+    logger = logging.getLogger("ProcessHost")
+
+    def __init__(self, workers: int, slots: int | None = None):
+        self.workers = workers
+        context = mp.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=_worker,
+                args=(self.requests, self.results),
+                name=f"node_host_{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+
+        self.slots = [FrameSlot(i) for i in range(slots or workers * 2)]
+        self._free = list(self.slots)
+        self._pending: dict[int, tuple[Future, FrameSlot]] = {}
+        self._jobs = itertools.count()
+        self._lock = Lock()
+        # Frames refused because every slot was in use
+        self.refused = 0
+
+        self.reader = Thread(name="node_host_results", target=self._read, daemon=True)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.reader.start()
+
+    def submit(
+        self, kernel: Callable[..., Any], image: np.ndarray, *args
+    ) -> Future | None:
+        """Runs kernel(image, *args) in a worker, or returns None if all are behind"""
+        with self._lock:
+            if len(self._free) == 0:
+                self.refused += 1
+                return None
+            slot = self._free.pop()
+
+            job = next(self._jobs)
+            future = Future()
+            self._pending[job] = (future, slot)
+
+        name = slot.write(image)
+        self.requests.put(
+            (job, kernel, slot.index, name, image.shape, image.dtype, args)
+        )
+        return future
+
+    def _read(self):
+        while True:
+            message = self.results.get()
+            if message is None:
+                break
+
+            job, result, error = message
+            with self._lock:
+                future, slot = self._pending.pop(job)
+                self._free.append(slot)
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def stop(self):
+        for _ in self.processes:
+            self.requests.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+        self.results.put(None)
+        self.reader.join()
+
+        with self._lock:
+            for future, _ in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+        for slot in self.slots:
+            slot.close()
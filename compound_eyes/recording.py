@@ -0,0 +1,297 @@
+from linuxpy.video import raw
+from linuxpy.video.device import (
+    BufferType,
+    Device,
+    Format,
+    Frame,
+    FrameIntervalType,
+    FrameType,
+    PixelFormat,
+)
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterator
+
+import asyncio
+import json
+import logging
+import mmap
+import struct
+import time
+
+# File layout:
+#   MAGIC, u32 header length, JSON header (device identity)
+#   repeated records: RECORD header followed by the raw frame bytes
+MAGIC = b"CEYEREC1"
+HEADER_LENGTH = struct.Struct("<I")
+# sequence, timestamp, pixel format, width, height, data length
+RECORD = struct.Struct("<QdIIII")
+
+
+def make_format(
+    width: int, height: int, pixel_format: PixelFormat, size: int, bytes_per_line: int
+) -> Format:
+    # linuxpy 0.23, which uv.lock pins, has no bytes_per_line; later versions do
+    fields = {
+        "width": width,
+        "height": height,
+        "pixel_format": pixel_format,
+        "size": size,
+        "bytes_per_line": bytes_per_line,
+    }
+    return Format(**{name: fields[name] for name in Format._fields})
+
+
+def make_frame(
+    data: bytes | memoryview,
+    width: int,
+    height: int,
+    pixel_format: PixelFormat,
+    sequence: int = 0,
+    timestamp: float = 0.0,
+) -> Frame:
+    buff = raw.v4l2_buffer()
+    buff.bytesused = len(data)
+    buff.sequence = sequence
+    buff.timestamp.secs = int(timestamp)
+    buff.timestamp.usecs = int((timestamp - int(timestamp)) * 1e6)
+    bytes_per_line = width * 2 if pixel_format == PixelFormat.YUYV else 0
+    return Frame(
+        data,
+        buff,
+        make_format(width, height, pixel_format, len(data), bytes_per_line),
+    )
+
+
+class FrameRecorder:
+    # Dumps raw frames exactly as they came off the device
+    def __init__(self, path: Path, device: Device):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file: BinaryIO | None = open(path, "wb")
+
+        header = json.dumps(
+            {
+                "bus_info": device.info.bus_info,
+                "driver": device.info.driver,
+                "card": device.info.card,
+            }
+        ).encode()
+        self.file.write(MAGIC)
+        self.file.write(HEADER_LENGTH.pack(len(header)))
+        self.file.write(header)
+
+        self.frames = 0
+
+    def write(self, frame: Frame):
+        if self.file is None:
+            return
+
+        data = frame.data
+        self.file.write(
+            RECORD.pack(
+                frame.frame_nb,
+                frame.timestamp,
+                frame.format.pixel_format,
+                frame.format.width,
+                frame.format.height,
+                len(data),
+            )
+        )
+        self.file.write(data)
+        self.frames += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+@dataclass
+class RecordedFrame:
+    sequence: int
+    timestamp: float
+    pixel_format: PixelFormat
+    width: int
+    height: int
+    offset: int
+    length: int
+
+
+@dataclass
+class ReplayInfo:
+    bus_info: str
+    driver: str
+    card: str
+    frame_sizes: list[FrameType]
+
+
+class Recording:
+    # Memory-mapped, read-only view of a file written by FrameRecorder
+    def __init__(self, path: Path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a frame recording")
+
+        offset = len(MAGIC)
+        (header_length,) = HEADER_LENGTH.unpack_from(self.mmap, offset)
+        offset += HEADER_LENGTH.size
+        self.header = json.loads(self.mmap[offset : offset + header_length])
+        offset += header_length
+
+        self.frames: list[RecordedFrame] = []
+        while offset + RECORD.size <= len(self.mmap):
+            sequence, timestamp, pixel_format, width, height, length = (
+                RECORD.unpack_from(self.mmap, offset)
+            )
+            offset += RECORD.size
+            if offset + length > len(self.mmap):
+                # recording was cut off mid-frame
+                break
+
+            self.frames.append(
+                RecordedFrame(
+                    sequence,
+                    timestamp,
+                    PixelFormat(pixel_format),
+                    width,
+                    height,
+                    offset,
+                    length,
+                )
+            )
+            offset += length
+
+        if len(self.frames) == 0:
+            raise ValueError(f"{path} contains no frames")
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def data(self, frame: RecordedFrame) -> memoryview:
+        return memoryview(self.mmap)[frame.offset : frame.offset + frame.length]
+
+    @property
+    def fps(self) -> int:
+        duration = self.frames[-1].timestamp - self.frames[0].timestamp
+        if duration <= 0:
+            return 30
+
+        return round((len(self.frames) - 1) / duration)
+
+    def frame_sizes(self) -> list[FrameType]:
+        fps = self.fps
+        sizes = {
+            (frame.pixel_format, frame.width, frame.height): None
+            for frame in self.frames
+        }
+        return [
+            FrameType(
+                type=FrameIntervalType.DISCRETE,
+                pixel_format=pixel_format,
+                width=width,
+                height=height,
+                min_fps=fps,
+                max_fps=fps,
+                step_fps=fps,
+            )
+            for pixel_format, width, height in sizes
+        ]
+
+
+class ReplayDevice:
+    # Stand-in for linuxpy's Device that plays back a recording, either paced like
+    # the original capture (speed=1.0) or as fast as it can be consumed (speed=None)
+    def __init__(self, path: Path, speed: float | None = 1.0, loop: bool = True):
+        self.filename = Path(path)
+        self.speed = speed
+        self.loop = loop
+        self.log = logging.getLogger(f"replay {self.filename.name}")
+        self.closed = True
+
+        self.recording = Recording(self.filename)
+        self.info = ReplayInfo(
+            bus_info=f"replay-{self.filename.stem}",
+            driver=self.recording.header.get("driver", "replay"),
+            card=self.recording.header.get("card", "replay"),
+            frame_sizes=self.recording.frame_sizes(),
+        )
+        self.controls: dict = {}
+
+        # Position survives re-iteration, like a live device keeps streaming
+        self.position = 0
+
+    def open(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def _schedule(self) -> Iterator[tuple[RecordedFrame, float]]:
+        # Yields each frame with the monotonic time it is due
+        frames = self.recording.frames
+        if self.position == len(frames):
+            self.position = 0
+        start = time.monotonic()
+        first = frames[self.position].timestamp
+
+        while not self.closed:
+            if self.position == len(frames):
+                if not self.loop:
+                    return
+
+                self.position = 0
+                start = time.monotonic()
+                first = frames[0].timestamp
+
+            recorded = frames[self.position]
+            if self.speed is not None:
+                due = start + (recorded.timestamp - first) / self.speed
+            else:
+                due = time.monotonic()
+
+            self.position += 1
+            yield recorded, due
+
+    def _frame(self, recorded: RecordedFrame, timestamp: float) -> Frame:
+        return make_frame(
+            self.recording.data(recorded),
+            recorded.width,
+            recorded.height,
+            recorded.pixel_format,
+            recorded.sequence,
+            timestamp,
+        )
+
+    def __iter__(self) -> Iterator[Frame]:
+        for recorded, due in self._schedule():
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            yield self._frame(recorded, due)
+
+    async def __aiter__(self) -> AsyncIterator[Frame]:
+        for recorded, due in self._schedule():
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+            yield self._frame(recorded, due)
+
+    def get_format(self, buffer_type: BufferType) -> Format:
+        recorded = self.recording.frames[min(self.position, len(self.recording) - 1)]
+        return make_format(
+            recorded.width, recorded.height, recorded.pixel_format, recorded.length, 0
+        )
+
+    def get_fps(self, buffer_type: BufferType) -> int:
+        return self.recording.fps
+
+    def set_format(self, buffer_type: BufferType, width, height, pixel_format):
+        self.log.warning("Cannot change the format of a recording")
+
+    def set_fps(self, buffer_type: BufferType, fps):
+        pass
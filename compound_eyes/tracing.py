@@ -0,0 +1,168 @@
+from collections import deque
+from ntcore import NetworkTable
+from pathlib import Path
+
+import json
+import numpy as np
+import threading
+import time
+
+# V4L2 buffer timestamps come from CLOCK_MONOTONIC, so every stage uses it too
+now = time.monotonic
+
+
+class Trace:
+    # Monotonic timestamps of the stages one frame went through, as (stage, start, end)
+    # spans. Stages that belong to the frame rather than this capture, like decoding,
+    # are shared with every copy of the capture.
+    def __init__(
+        self,
+        origin: float,
+        sequence: int,
+        shared: list[tuple[str, float, float]] | None = None,
+    ):
+        self.origin = origin
+        self.sequence = sequence
+        self.shared: list[tuple[str, float, float]] = [] if shared is None else shared
+        self.own: list[tuple[str, float, float]] = []
+        self._open: dict[str, float] = {}
+
+    def copy(self) -> "Trace":
+        trace = Trace(self.origin, self.sequence, self.shared)
+        trace.own = list(self.own)
+        trace._open = dict(self._open)
+        return trace
+
+    def enter(self, stage: str):
+        self._open[stage] = now()
+
+    def exit(self, stage: str) -> float | None:
+        start = self._open.pop(stage, None)
+        if start is None:
+            return None
+
+        end = now()
+        self.own.append((stage, start, end))
+        return end - start
+
+    def add_span(self, stage: str, start: float, end: float):
+        self.own.append((stage, start, end))
+
+    @property
+    def spans(self) -> list[tuple[str, float, float]]:
+        return sorted(self.own + self.shared, key=lambda span: span[1])
+
+    def durations(self) -> dict[str, float]:
+        spans = self.spans
+        durations = {stage: end - start for stage, start, end in spans}
+        if len(spans) != 0:
+            durations["total"] = max(end for _, _, end in spans) - self.origin
+
+        return durations
+
+
+class LatencyTracker:
+    # Keeps the traces of recently delivered frames for one camera and publishes
+    # per-stage latency percentiles
+    percentiles = (50, 95, 99)
+
+    def __init__(self, table: NetworkTable, name: str, window: int = 300):
+        self.table = table
+        self.name = name
+        self.traces: deque[Trace] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        self.publishers = {}
+        self.publish_period = 1.0
+        self._last_publish = 0.0
+
+        export_topic = table.getBooleanTopic("export_trace")
+        self.export_entry = export_topic.getEntry(False)
+        self.export_entry.set(False)
+
+    def record(self, trace: Trace):
+        with self._lock:
+            self.traces.append(trace)
+
+    def stats(self) -> dict[str, dict[int, float]]:
+        with self._lock:
+            traces = list(self.traces)
+
+        by_stage: dict[str, list[float]] = {}
+        for trace in traces:
+            for stage, duration in trace.durations().items():
+                by_stage.setdefault(stage, []).append(duration)
+
+        return {
+            stage: {
+                percentile: float(value)
+                for percentile, value in zip(
+                    self.percentiles, np.percentile(durations, self.percentiles)
+                )
+            }
+            for stage, durations in by_stage.items()
+        }
+
+    def periodic(self):
+        if self.export_entry.get():
+            self.export_entry.set(False)
+            self.export_chrome_trace(
+                Path("traces") / f"{self.name}_{int(time.time())}.json"
+            )
+
+        timestamp = now()
+        if timestamp - self._last_publish < self.publish_period:
+            return
+        self._last_publish = timestamp
+
+        for stage, percentiles in self.stats().items():
+            for percentile, value in percentiles.items():
+                key = (stage, percentile)
+                publisher = self.publishers.get(key)
+                if publisher is None:
+                    publisher = (
+                        self.table.getSubTable(stage)
+                        .getDoubleTopic(f"p{percentile}_ms")
+                        .publish()
+                    )
+                    self.publishers[key] = publisher
+
+                publisher.set(value * 1000)
+
+    def chrome_trace(self) -> dict:
+        """Trace Event Format, loadable in chrome://tracing or ui.perfetto.dev"""
+        with self._lock:
+            traces = list(self.traces)
+
+        events = []
+        for trace in traces:
+            events.append(
+                {
+                    "name": "v4l2",
+                    "ph": "i",
+                    "s": "t",
+                    "ts": trace.origin * 1e6,
+                    "pid": self.name,
+                    "tid": "v4l2",
+                    "args": {"frame": trace.sequence},
+                }
+            )
+            for stage, start, end in trace.spans:
+                events.append(
+                    {
+                        "name": stage,
+                        "ph": "X",
+                        "ts": start * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": self.name,
+                        "tid": stage,
+                        "args": {"frame": trace.sequence},
+                    }
+                )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,25 +1,85 @@
-import time
+import argparse
 import logging
+from pathlib import Path
 from ntcore import NetworkTableInstance
 from compound_eyes.camera_manager import CameraManager
+from compound_eyes.device_watcher import DeviceWatcher
 import socket
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--record", type=Path, help="directory to dump raw frames from every camera"
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        action="append",
+        default=[],
+        help="recording to play back as a camera, may be repeated",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="playback rate relative to the recording, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--async-capture",
+        action="store_true",
+        help="dequeue frames for every camera on one shared event loop",
+    )
+    parser.add_argument(
+        "--process-workers",
+        type=int,
+        default=0,
+        help="worker processes for focus scoring and Charuco detection, 0 to run them in-process",
+    )
+    parser.add_argument(
+        "--sync-tolerance-ms",
+        type=float,
+        help="bundle frames from every camera whose timestamps are this close",
+    )
+    parser.add_argument(
+        "--debug-port",
+        type=int,
+        default=5820,
+        help="port serving every camera's debug stream",
+    )
+    args = parser.parse_args()
+
     nt = NetworkTableInstance.getDefault()
     # nt.startClient4(f"{socket.gethostname()}-compoundeyes")
     # nt.setServer("localhost")
     nt.startServer('0.0.0.0')
 
-    camera_manager = CameraManager(nt.getTable("cameras"))
+    camera_manager = CameraManager(
+        nt.getTable("cameras"),
+        record_dir=args.record,
+        replay_files=args.replay,
+        replay_speed=args.replay_speed or None,
+        async_capture=args.async_capture,
+        process_workers=args.process_workers,
+        sync_tolerance=(
+            None if args.sync_tolerance_ms is None else args.sync_tolerance_ms / 1000
+        ),
+        debug_port=args.debug_port,
+    )
+
+    watcher = DeviceWatcher()
 
     try:
-        while True:
-            camera_manager.load_cameras()
+        camera_manager.load_cameras()
 
-            time.sleep(0.1)
+        while True:
+            # Short timeout so Ctrl+C is handled promptly. Without inotify the
+            # watcher returns every 100 ms poll instead.
+            if watcher.wait(timeout=1.0):
+                camera_manager.load_cameras()
 
     finally:
+        watcher.close()
         camera_manager.unload_cameras()
         nt.stopServer()
 
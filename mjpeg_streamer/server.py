@@ -1,6 +1,7 @@
 import asyncio
 import threading
-from typing import List, Union
+import time
+from typing import Awaitable, Callable, List, Union
 
 import aiohttp
 from aiohttp import MultipartWriter, web
@@ -16,16 +17,14 @@ class _StreamHandler:
 
     async def __call__(self, request: web.Request) -> web.StreamResponse:
         args = request.url.query
-        if "fps" in args:
-            self._stream.set_fps(int(args["fps"]))
-        if "compression" in args:
-            self._stream.set_quality(int(args["compression"]))
+        # Everything asked for in the query only applies to this viewer
+        fps = int(args["fps"]) if "fps" in args else None
+        quality = int(args["compression"]) if "compression" in args else None
+        size = None
         if "resolution" in args:
             reso = args["resolution"].split("x")
-            self._stream.set_size((int(reso[0]), int(reso[1])))
-        else:
-            self._stream.set_size(None)
-        viewer_token = request.cookies.get("viewer_token")
+            size = (int(reso[0]), int(reso[1]))
+        variant = self._stream._variant(size, quality)
         response = web.StreamResponse(
             status=200,
             reason="OK",
@@ -37,16 +36,19 @@ class _StreamHandler:
             await response.prepare(request)
         except (ConnectionResetError, ConnectionAbortedError, ConnectionError):
             pass
-        if not viewer_token:
-            viewer_token = await self._stream._add_viewer()
-            response.set_cookie("viewer_token", viewer_token)
-        elif viewer_token not in self._stream._active_viewers:
-            await self._stream._add_viewer(viewer_token)
+        # Every connection is its own viewer, with its own variant of the stream.
+        # Not keyed by a viewer_token cookie: two tabs of one browser would share
+        # it, and closing either would end the other's demand.
+        viewer_token = await self._stream._add_viewer(variant=variant)
         try:
+            # Start from the next frame, not one encoded before this viewer came along
+            sequence = self._stream._current_sequence()
             while True:
                 try:
-                    await asyncio.sleep(1 / self._stream.fps)
-                    frame = await self._stream._get_frame()
+                    sequence, frame, trace = await self._stream._wait_frame(
+                        sequence, variant
+                    )
+                    start = time.monotonic()
                     with MultipartWriter(
                         "image/jpeg", boundary="image-boundary"
                     ) as mpwriter:
@@ -56,6 +58,12 @@ class _StreamHandler:
                         )
                         await mpwriter.write(response, close_boundary=False)
                     await response.write(b"\r\n")
+                    self._stream._record_write(sequence, trace, start)
+
+                    # Frames that arrive faster than the requested fps are skipped
+                    delay = start + 1 / (fps or self._stream.fps) - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
                 except (ConnectionResetError, ConnectionAbortedError, ConnectionError):
                     break
         finally:
@@ -85,6 +93,15 @@ class Server:
         self._app_is_running: bool = False
         self._stream = stream
 
+    def add_route(
+        self,
+        method: str,
+        path: str,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> None:
+        # Only takes effect when added before start()
+        self._app.router.add_route(method, path, handler)
+
     def is_running(self) -> bool:
         return self._app_is_running
 
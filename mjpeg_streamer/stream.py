@@ -1,89 +1,185 @@
 import asyncio
+import threading
 import time
 import uuid
-from collections import deque
-from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
 
 import cv2
 import numpy as np
 
+# What a viewer asked for: (size, quality), None meaning the stream's own setting
+Variant = Tuple[Optional[Tuple[int, int]], Optional[int]]
+
+# Resizing and encoding run here rather than on the server's event loop or the
+# thread that sets frames. OpenCV releases the GIL while it works, so a couple of
+# threads shared by every stream are enough to keep a large encode from stalling
+# the other connections.
+_ENCODER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mjpeg_encode")
+
+
+def _jpeg_end(frame: np.ndarray) -> Optional[int]:
+    """Length of the JPEG in a 1-D buffer up to its last EOI (0xFFD9), if any"""
+    # Some cameras pad the buffer after EOI, so it isn't always the last two bytes
+    if frame[-2] == 255 and frame[-1] == 217:
+        return frame.size
+
+    eoi = np.flatnonzero((frame[:-1] == 255) & (frame[1:] == 217))
+    if eoi.size == 0:
+        return None
+    return int(eoi[-1]) + 2
+
+
+def _check_encoding(frame: np.ndarray) -> str:
+    if isinstance(frame, np.ndarray) and frame.ndim == 1 and frame.size > 2:
+        # Check JPG header (0xFFD8) and footer (0xFFD9)
+        if frame[0] == 255 and frame[1] == 216 and _jpeg_end(frame) is not None:
+            return "jpg"
+        return "one-dim-non-jpg"
+    if isinstance(frame, np.ndarray):
+        return "multi-dim"
+    return "unknown"
+
+
+def _resize_and_encode(
+    frame: np.ndarray, size: Tuple[int, int], quality: int
+) -> np.ndarray:
+    if (frame.shape[1], frame.shape[0]) != size:
+        frame = cv2.resize(frame, size)
+    val, encoded_frame = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not val:
+        raise ValueError(f"Error encoding frame. Format/shape: {_check_encoding(frame)}")
+    return encoded_frame
+
 
 class StreamBase:
     def __init__(
         self,
         name: str,
         fps: int = 30,
+        encoder: Optional[Executor] = None,
     ) -> None:
         self.name = name.casefold().replace(" ", "_")
         self.fps = fps
+        self._encoder = encoder or _ENCODER
         self._frame: np.ndarray = np.zeros((320, 240, 1), dtype=np.uint8)
         self._last_processed_frame: np.ndarray = cv2.imencode(
             ".jpg", self._frame, [cv2.IMWRITE_JPEG_QUALITY, 1]
         )[1]
         self._lock: asyncio.Lock = asyncio.Lock()
-        self._frames_buffer: Deque[int] = deque(maxlen=fps)
-        self._bandwidth_last_modified_time: float = time.time()
-        self._active_viewers: Set[str] = set()
-        self._tasks: Dict[str, asyncio.Task] = {"_clear_bandwidth": None}
+        # (time, size) of the frames encoded recently
+        self._frames_buffer: Deque[Tuple[float, int]] = deque(maxlen=fps)
+        # Every viewer and the variant it asked for
+        self._active_viewers: Dict[str, Variant] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Frames are numbered and encoded in set_frame(), once for every variant a
+        # viewer is watching. Viewers wait on the condition for a sequence number
+        # newer than the last one they sent.
+        self._sequence: int = 0
+        # (sequence, trace), the trace being anything with add_span(stage, start, end)
+        self._encoded: Optional[Tuple[int, Optional[Any]]] = None
+        # Recently encoded frames by (sequence, variant), least recently used first.
+        # Holds at least two frames of every variant being watched, so a viewer's
+        # frame isn't evicted by the other variants before the viewer gets to it.
+        self._cache: "OrderedDict[Tuple[int, Variant], np.ndarray]" = OrderedDict()
+        self.cache_size = 8
+        self._cache_lock = threading.Lock()
+        self._written: int = 0
+        # At most one frame per stream is encoding, the latest frame set while it
+        # does waits as (sequence, frame, trace, queued) and replaces any older one
+        self._encode_lock = threading.Lock()
+        self._encoding: bool = False
+        self._pending: Optional[Tuple[int, np.ndarray, Optional[Any], float]] = None
+        # (time, encode, queue wait) of the frames encoded recently, in seconds
+        self._encode_buffer: Deque[Tuple[float, float, float]] = deque(maxlen=fps)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._condition: Optional[asyncio.Condition] = None
 
     async def _ensure_background_tasks(self) -> None:
         for task_name, task in self._tasks.items():
             if task is None or task.done():
                 self._tasks[task_name] = asyncio.create_task(
-                    eval(f"self.{task_name}()")
+                    getattr(self, task_name)()
                 )
 
-    async def _clear_bandwidth(self) -> None:
-        while True:
-            await asyncio.sleep(1.0 / self.fps)
-            if (
-                len(self._frames_buffer) > 0
-                and time.time() - self._bandwidth_last_modified_time >= 1
-            ):
-                self._frames_buffer.clear()
-
-    async def _add_viewer(self, viewer_token: Optional[str] = None) -> str:
+    async def _add_viewer(
+        self, viewer_token: Optional[str] = None, variant: Variant = (None, None)
+    ) -> str:
         viewer_token = viewer_token or str(uuid.uuid4())
         async with self._lock:
-            self._active_viewers.add(viewer_token)
+            if self._condition is None:
+                # Frames are set from other threads and announced on this loop
+                self._loop = asyncio.get_running_loop()
+                self._condition = asyncio.Condition()
+            self._active_viewers[viewer_token] = variant
         return viewer_token
 
     async def _remove_viewer(self, viewer_token: str) -> None:
         async with self._lock:
-            self._active_viewers.discard(viewer_token)
+            self._active_viewers.pop(viewer_token, None)
+
+    def _variant(
+        self, size: Optional[Tuple[int, int]], quality: Optional[int]
+    ) -> Variant:
+        if quality is not None:
+            quality = max(1, min(quality, 100))
+        return size, quality
+
+    def _encode(self, frame: np.ndarray, variant: Variant = (None, None)) -> np.ndarray:
+        return frame
+
+    def _encode_variants(
+        self, frame: np.ndarray, variants: Set[Variant]
+    ) -> Dict[Variant, np.ndarray]:
+        return {variant: self._encode(frame, variant) for variant in variants}
+
+    def _cache_limit(self) -> int:
+        return max(self.cache_size, 2 * len(set(self._active_viewers.values())))
+
+    def _cache_put(self, key: Tuple[int, Variant], frame: np.ndarray) -> None:
+        limit = self._cache_limit()
+        with self._cache_lock:
+            self._cache[key] = frame
+            self._cache.move_to_end(key)
+            while len(self._cache) > limit:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, key: Tuple[int, Variant]) -> Optional[np.ndarray]:
+        with self._cache_lock:
+            frame = self._cache.get(key)
+            if frame is not None:
+                self._cache.move_to_end(key)
+            return frame
+
+    def _timed(
+        self, queued: float, func: Callable[..., Any], *args: Any
+    ) -> Tuple[Any, float, float]:
+        start = time.monotonic()
+        result = func(*args)
+        end = time.monotonic()
+        self._encode_buffer.append((end, end - start, start - queued))
+        return result, start, end
+
+    async def _run_encoder(self, func: Callable[..., Any], *args: Any) -> Any:
+        # The loop only waits for the finished buffer
+        loop = asyncio.get_running_loop()
+        result, _, _ = await loop.run_in_executor(
+            self._encoder, self._timed, time.monotonic(), func, *args
+        )
+        return result
 
     async def _process_current_frame(self) -> np.ndarray:
-        self._last_processed_frame = self._frame
-        return self._frame
-
-    async def __check_encoding(self, frame: np.ndarray) -> str:
-        if isinstance(frame, np.ndarray) and frame.ndim == 1 and frame.size > 2:
-            # Check JPG header (0xFFD8) and footer (0xFFD9)
-            if (
-                frame[0] == 255
-                and frame[1] == 216
-                and frame[-2] == 255
-                and frame[-1] == 217
-            ):
-                return "jpg"
-            return "one-dim-non-jpg"
-        if isinstance(frame, np.ndarray):
-            return "multi-dim"
-        return "unknown"
+        self._last_processed_frame = await self._run_encoder(self._encode, self._frame)
+        return self._last_processed_frame
+
+    async def _is_jpeg(self, frame: np.ndarray) -> bool:
+        return _check_encoding(frame) == "jpg"
 
     async def _resize_and_encode_frame(
         self, frame: np.ndarray, size: Tuple[int, int], quality: int
     ) -> np.ndarray:
-        resized_frame = cv2.resize(frame, size)
-        if not await self.__check_encoding(resized_frame) == "jpg":
-            val, encoded_frame = cv2.imencode(
-                ".jpg", resized_frame, [cv2.IMWRITE_JPEG_QUALITY, quality]
-            )
-        if not val:
-            raise ValueError(
-                f"Error encoding frame. Format/shape: {await self.__check_encoding(resized_frame)}"
-            )
-        return encoded_frame
+        return await self._run_encoder(_resize_and_encode, frame, size, quality)
 
     def settings(self) -> None:
         for key, value in self.__dict__.items():
@@ -97,24 +193,136 @@ class StreamBase:
     def active_viewers(self) -> int:
         return len(self._active_viewers)
 
+    def _record_bandwidth(self, frame: np.ndarray) -> None:
+        self._frames_buffer.append((time.monotonic(), frame.nbytes))
+
     def get_bandwidth(self) -> float:
-        return sum(self._frames_buffer)
+        cutoff = time.monotonic() - 1
+        return sum(size for timestamp, size in self._frames_buffer if timestamp >= cutoff)
+
+    def get_encode_stats(self) -> Dict[str, float]:
+        """Mean and worst encode time and queue wait over the last second, in ms"""
+        cutoff = time.monotonic() - 1
+        recent = [
+            (encode, wait)
+            for timestamp, encode, wait in self._encode_buffer
+            if timestamp >= cutoff
+        ]
+        if len(recent) == 0:
+            return {}
+
+        encodes, waits = zip(*recent)
+        return {
+            "encodes": len(recent),
+            "encode_ms": 1000 * sum(encodes) / len(recent),
+            "encode_max_ms": 1000 * max(encodes),
+            "queue_wait_ms": 1000 * sum(waits) / len(recent),
+            "queue_wait_max_ms": 1000 * max(waits),
+        }
 
     def set_fps(self, fps: int) -> None:
         self.fps = fps
         self._frames_buffer = deque(maxlen=fps)
+        self._encode_buffer = deque(maxlen=fps)
+
+    def _current_sequence(self) -> int:
+        return self._sequence
+
+    async def _wait_frame(
+        self, after: int, variant: Variant = (None, None)
+    ) -> Tuple[int, np.ndarray, Optional[Any]]:
+        """The first frame numbered after `after` encoded as variant, as (sequence, jpeg, trace)"""
+        result = None
+
+        def ready() -> bool:
+            nonlocal result
+            if self._encoded is None or self._encoded[0] <= after:
+                return False
+
+            sequence, trace = self._encoded
+            frame = self._cache_get((sequence, variant))
+            if frame is None:
+                # A viewer that just arrived, its variant is encoded from the next frame
+                return False
+
+            result = (sequence, frame, trace)
+            return True
+
+        async with self._condition:
+            await self._condition.wait_for(ready)
+            return result
 
     async def _get_frame(self) -> np.ndarray:
-        await self._ensure_background_tasks()  # A little hacky
-        if time.time() - self._bandwidth_last_modified_time <= 1.0 / self.fps:
-            return self._last_processed_frame  # Prevents redundant processing
+        # For streams that produce frames when a viewer asks, like ManagedStream
+        await self._ensure_background_tasks()
         async with self._lock:
-            self._frames_buffer.append(len(self._last_processed_frame.tobytes()))
-            self._bandwidth_last_modified_time = time.time()
-            return await self._process_current_frame()
+            frame = await self._process_current_frame()
+            self._record_bandwidth(frame)
+            return frame
 
-    def set_frame(self, frame: np.ndarray) -> None:
+    def _record_write(
+        self, sequence: int, trace: Optional[Any], start: float
+    ) -> None:
+        # Only the first viewer to send a frame adds to its trace
+        if trace is not None and sequence > self._written:
+            self._written = sequence
+            trace.add_span("write", start, time.monotonic())
+
+    def set_frame(self, frame: np.ndarray, trace: Optional[Any] = None) -> None:
+        """Hands the frame to the encoder and returns without waiting for it"""
         self._frame = frame
+        with self._encode_lock:
+            self._sequence += 1
+            if not self.has_demand():
+                # Nobody would see it, so don't pay for the encode
+                return
+
+            self._pending = (self._sequence, frame, trace, time.monotonic())
+            if self._encoding:
+                # Picked up when the frame being encoded is done
+                return
+            self._encoding = True
+
+        self._encode_next()
+
+    def _encode_next(self) -> None:
+        with self._encode_lock:
+            pending, self._pending = self._pending, None
+            if pending is None:
+                self._encoding = False
+                return
+
+        self._encoder.submit(self._encode_pending, *pending)
+
+    def _encode_pending(
+        self, sequence: int, frame: np.ndarray, trace: Optional[Any], queued: float
+    ) -> None:
+        try:
+            # One encode per variant, however many viewers share it
+            variants = set(self._active_viewers.values())
+            encoded, start, end = self._timed(
+                queued, self._encode_variants, frame, variants
+            )
+            if trace is not None:
+                trace.add_span("encode_queue", queued, start)
+                trace.add_span("encode", start, end)
+            for variant, jpeg in encoded.items():
+                self._record_bandwidth(jpeg)
+                self._cache_put((sequence, variant), jpeg)
+                self._last_processed_frame = jpeg
+            self._encoded = (sequence, trace)
+
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(self._announce(), loop)
+        except Exception as e:
+            print(f"Error encoding frame: {e}")
+        finally:
+            self._encode_next()
+
+    async def _announce(self) -> None:
+        async with self._condition:
+            self._condition.notify_all()
 
 
 class Stream(StreamBase):
@@ -124,20 +332,47 @@ class Stream(StreamBase):
         fps: int = 30,
         size: Optional[Tuple[int, int]] = None,
         quality: int = 50,
+        encoder: Optional[Executor] = None,
     ) -> None:
-        super().__init__(name, fps)
+        super().__init__(name, fps, encoder)
         self.size = size
         self.quality = max(1, min(quality, 100))
         self._last_processed_frame: np.ndarray = np.zeros((320, 240, 1), dtype=np.uint8)
 
-    async def _process_current_frame(self) -> np.ndarray:
-        frame = await self._resize_and_encode_frame(
-            self._frame,
-            self.size or (self._frame.shape[1], self._frame.shape[0]),
-            self.quality,
-        )
-        self._last_processed_frame = frame
-        return frame
+    def _encode(self, frame: np.ndarray, variant: Variant = (None, None)) -> np.ndarray:
+        return self._encode_variants(frame, {variant})[variant]
+
+    def _encode_variants(
+        self, frame: np.ndarray, variants: Set[Variant]
+    ) -> Dict[Variant, np.ndarray]:
+        encoded = {}
+        decoded = None
+        for variant in variants:
+            size = variant[0] or self.size
+            quality = variant[1]
+            encoding = _check_encoding(frame)
+            if encoding == "jpg" and size is None and quality is None:
+                # Already encoded upstream, send it as-is without any padding
+                encoded[variant] = frame[: _jpeg_end(frame)]
+                continue
+
+            if encoding in ("jpg", "one-dim-non-jpg"):
+                # A buffer, not pixels: decoded once for every variant that needs it
+                if decoded is None:
+                    decoded = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+                    if decoded is None:
+                        raise ValueError("Error decoding frame. Format/shape: " + encoding)
+                image = decoded
+            else:
+                image = frame
+
+            encoded[variant] = _resize_and_encode(
+                image,
+                size or (image.shape[1], image.shape[0]),
+                quality or self.quality,
+            )
+
+        return encoded
 
     def set_size(self, size: Tuple[int, int] | None) -> None:
         self.size = size
@@ -156,8 +391,9 @@ class ManagedStream(StreamBase):
         quality: int = 50,
         mode: str = "fast-on-demand",
         poll_delay_ms: Optional[Union[float, int]] = None,
+        encoder: Optional[Executor] = None,
     ) -> None:
-        super().__init__(name, fps)
+        super().__init__(name, fps, encoder)
         self.source = source
         self.mode = mode
         self._available_modes: List[str,] = ["fast-on-demand", "full-on-demand"]
@@ -228,6 +464,13 @@ class ManagedStream(StreamBase):
             )
         return await super()._get_frame()
 
+    async def _wait_frame(
+        self, after: int, variant: Variant = (None, None)
+    ) -> Tuple[int, np.ndarray, Optional[Any]]:
+        # Frames are read from the capture when asked for, at the stream's rate
+        await asyncio.sleep(1 / self.fps)
+        return after + 1, await self._get_frame(), None
+
     def set_size(self, size: Tuple[int, int]) -> None:
         self.size = size
 
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+from linuxpy.video.device import PixelFormat
+
+from compound_eyes.benchmark import encode_frame_data, synthetic_image
+from compound_eyes.benchmark.graph import synthetic_frames
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.recording import FrameRecorder, make_frame
+
+
+def capture(
+    width: int = 64,
+    height: int = 48,
+    pixel_format: PixelFormat = PixelFormat.MJPEG,
+    sequence: int = 0,
+) -> Capture:
+    """A fresh capture of a synthetic frame"""
+    data = encode_frame_data(synthetic_image(width, height), pixel_format)
+    frame = make_frame(data, width, height, pixel_format, sequence)
+    return Capture(frame, FrameDecoder())
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """A short MJPEG recording to replay as a camera"""
+    path = tmp_path / "test.frames"
+    device = SimpleNamespace(
+        info=SimpleNamespace(bus_info="usb-test", driver="uvc", card="cam")
+    )
+    recorder = FrameRecorder(path, device)
+    for frame in synthetic_frames(320, 240, PixelFormat.MJPEG, board=False, count=4):
+        recorder.write(frame)
+    recorder.close()
+    return path
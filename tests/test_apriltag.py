@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+from linuxpy.video.device import PixelFormat
+from ntcore import NetworkTableInstance
+
+from compound_eyes.benchmark import encode_frame_data
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.node.apriltag import AprilTagNode
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.recording import make_frame
+
+
+def tag_capture(tag_id: int, pixel_format: PixelFormat) -> Capture:
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    tag = cv2.aruco.generateImageMarker(dictionary, tag_id, 160)
+    image = np.full((480, 640), 255, np.uint8)
+    image[160:320, 240:400] = tag
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    data = encode_frame_data(image, pixel_format)
+    return Capture(make_frame(data, 640, 480, pixel_format), FrameDecoder())
+
+
+def test_publishes_detected_tags():
+    table = NetworkTableInstance.create().getTable("apriltag")
+    source = Mailbox()
+    node = AprilTagNode(source, table, "test")
+
+    for pixel_format in (PixelFormat.MJPEG, PixelFormat.YUYV):
+        source.put(tag_capture(7, pixel_format))
+        assert node.step()
+
+        assert list(table.getEntry("ids").getIntegerArray([])) == [7]
+        x, y = table.getEntry("centers").getDoubleArray([])
+        assert abs(x - 320) < 2 and abs(y - 240) < 2
+
+    assert not node.step()
@@ -0,0 +1,74 @@
+import cv2
+from linuxpy.video.device import PixelFormat
+
+from compound_eyes.benchmark.graph import calibration_config, synthetic_frames
+from compound_eyes.calibration_routine import CalibrationRoutine
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import FULL, Capture
+from compound_eyes.node import DetectCharucoNode
+from compound_eyes.node.edge import Mailbox
+
+from test_decimate import AdmitFirst
+
+
+def board_capture() -> Capture:
+    frame = synthetic_frames(640, 480, PixelFormat.MJPEG, board=True, count=1)[0]
+    return Capture(frame, FrameDecoder())
+
+
+def routine(dirpath) -> CalibrationRoutine:
+    routine = CalibrationRoutine(calibration_config(640, 480))
+    routine.dirpath = dirpath
+    return routine
+
+
+def test_draws_at_preview_scale(tmp_path):
+    calibration = routine(tmp_path)
+    board = board_capture()
+
+    calibration.apply(board, calibration.detect(board), scale=2)
+
+    assert board.metadata["corners_found"] > 0
+    assert (2, False) in board._overlays
+    assert FULL not in board._overlays
+
+
+def test_measures_without_painting(tmp_path):
+    calibration = routine(tmp_path)
+    board = board_capture()
+
+    calibration.apply(board, calibration.detect(board), paint=False)
+
+    assert board.metadata["corners_found"] > 0
+    assert board._overlays == {}
+
+
+def test_images_are_saved_in_color(tmp_path):
+    calibration = routine(tmp_path)
+    board = board_capture()
+
+    calibration.apply(board, calibration.detect(board), paint=False)
+
+    saved = cv2.imread(str(tmp_path / "img1.png"), cv2.IMREAD_UNCHANGED)
+    assert saved.shape == (480, 640, 3)
+
+
+def test_skipped_frames_are_repainted(tmp_path):
+    source, sink = Mailbox(), Mailbox()
+    node = DetectCharucoNode(
+        source, sink, "test", decimator=AdmitFirst(), preview_scale=2
+    )
+    node.begin_calibration(routine(tmp_path))
+
+    source.put(board_capture())
+    node.step()
+    processed = sink.get_nowait()
+
+    source.put(board_capture())
+    node.step()
+    skipped = sink.get_nowait()
+
+    # The corners aren't looked for again, but they're still on the stream
+    assert len(list(tmp_path.iterdir())) == 1
+    assert skipped.metadata == processed.metadata
+    assert (2, False) in skipped._overlays
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+
+from ntcore import NetworkTableInstance
+
+from compound_eyes.camera_manager import Camera
+from compound_eyes.debug_server import DebugServer
+from compound_eyes.event_loop import EventLoopThread
+from compound_eyes.node.scheduler import Scheduler
+from compound_eyes.recording import ReplayDevice
+
+
+class HungDevice(ReplayDevice):
+    # A camera that stops delivering frames without closing
+    async def __aiter__(self):
+        await asyncio.Event().wait()
+        yield
+
+
+def make_camera(device, event_loop, server, scheduler) -> Camera:
+    table = NetworkTableInstance.create().getTable("cameras")
+    return Camera(device, table, server, scheduler, event_loop=event_loop)
+
+
+def test_stop_cancels_a_hung_async_capture(recording, tmp_path):
+    event_loop = EventLoopThread("test")
+    event_loop.start()
+    server = DebugServer(0, "127.0.0.1")
+    scheduler = Scheduler(1)
+    device = HungDevice(recording)
+    camera = make_camera(device, event_loop, server, scheduler)
+    camera.start()
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    camera.stop(timeout=0.2)
+
+    assert time.monotonic() - start < 1
+    assert camera.main_future.cancelled()
+    # The capture loop still closes the device on its way out
+    time.sleep(0.1)
+    assert device.closed
+
+    scheduler.shutdown()
+    event_loop.stop()
+
+
+def test_executor_failures_are_logged(recording, caplog):
+    event_loop = EventLoopThread("test")
+    event_loop.start()
+    server = DebugServer(0, "127.0.0.1")
+    scheduler = Scheduler(1)
+    camera = make_camera(ReplayDevice(recording), event_loop, server, scheduler)
+
+    def fail():
+        raise RuntimeError("mrcal failed")
+
+    with caplog.at_level(logging.ERROR):
+        event_loop.loop.call_soon_threadsafe(camera.run_blocking, fail)
+        time.sleep(0.2)
+
+    assert "fail failed" in caplog.text
+    assert "mrcal failed" in caplog.text
+
+    camera.graph.stop()
+    scheduler.shutdown()
+    event_loop.stop()
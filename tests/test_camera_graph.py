@@ -0,0 +1,74 @@
+import time
+
+from linuxpy.video.device import PixelFormat
+from ntcore import NetworkTableInstance
+
+from compound_eyes.benchmark.graph import synthetic_frames
+from compound_eyes.camera_graph import CameraGraph
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.debug_server import DebugServer
+from compound_eyes.node import DetectCharucoNode
+from compound_eyes.node.decimate import Decimator
+from compound_eyes.node.scheduler import Scheduler
+
+
+def make_graph(scheduler: Scheduler, **kwargs) -> CameraGraph:
+    table = NetworkTableInstance.create().getTable("cameras").getSubTable("usb-1")
+    return CameraGraph(
+        "usb-1", scheduler, table, DebugServer(0, "127.0.0.1"), **kwargs
+    )
+
+
+def test_builds_every_mode():
+    scheduler = Scheduler(1)
+    graph = make_graph(scheduler, calibration_rate=5.0, latency_budget=0.05)
+
+    assert set(graph.modes) == {"setup", "focus", "calibration"}
+    assert isinstance(graph.calibration_node, DetectCharucoNode)
+    decimator = graph.calibration_node.decimator
+    assert isinstance(decimator, Decimator)
+    assert (decimator.target_rate, decimator.latency_budget) == (5.0, 0.05)
+
+    graph.stop()
+    scheduler.shutdown()
+
+
+def test_frames_reach_the_debug_node():
+    scheduler = Scheduler(1)
+    graph = make_graph(scheduler)
+    graph.activate("focus")
+
+    decoder = FrameDecoder()
+    for frame in synthetic_frames(320, 240, PixelFormat.MJPEG, board=False, count=3):
+        graph.frames.put(Capture(frame, decoder))
+        time.sleep(0.05)
+
+    deadline = time.monotonic() + 2
+    while graph.debug_node.metrics.processed == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert graph.decode_node.metrics.processed > 0
+    assert graph.debug_node.metrics.processed > 0
+
+    graph.stop()
+    scheduler.shutdown()
+
+
+def test_views_follow_the_active_mode():
+    scheduler = Scheduler(1)
+    graph = make_graph(scheduler, apriltag=True)
+
+    graph.activate("setup")
+    # Nobody watches the stream, so only AprilTags read pixels
+    assert graph.views() == {(1, True)}
+
+    graph.activate("focus")
+    assert graph.views() == {(1, True), (2, True)}
+
+    graph.calibration_node.begin_calibration(object())
+    graph.activate("calibration")
+    assert graph.views() == {(1, True)}
+
+    graph.stop()
+    scheduler.shutdown()
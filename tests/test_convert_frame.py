@@ -0,0 +1,79 @@
+import numpy as np
+from linuxpy.video.device import PixelFormat
+
+from compound_eyes.benchmark import encode_frame_data, synthetic_image
+from compound_eyes.benchmark.decode import legacy_process_frame, measure
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import BufferPool
+from compound_eyes.recording import make_frame
+
+
+def yuyv_frame(width=64, height=48, length=None):
+    data = encode_frame_data(synthetic_image(width, height), PixelFormat.YUYV)
+    if length is not None:
+        data = data[:length]
+    return make_frame(data, width, height, PixelFormat.YUYV)
+
+
+def test_buffer_pool_reuses_released_buffers():
+    pool = BufferPool((4, 4), max_size=2)
+
+    first = pool.acquire()
+    address = first.ctypes.data
+    del first
+
+    assert pool.acquire().ctypes.data == address
+
+
+def test_buffer_pool_skips_buffers_in_use():
+    pool = BufferPool((4, 4), max_size=2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    view = second[1:]
+    del second
+
+    assert not np.shares_memory(first, view)
+    third = pool.acquire()
+    assert not np.shares_memory(third, first)
+    assert not np.shares_memory(third, view)
+
+
+def test_buffer_pool_stops_growing_at_max_size():
+    pool = BufferPool((4, 4), max_size=1)
+
+    held = [pool.acquire() for _ in range(3)]
+
+    assert len(pool._buffers) == 1
+    assert len({buffer.ctypes.data for buffer in held}) == 3
+
+
+def test_pooled_decode_matches_legacy():
+    decoder = FrameDecoder()
+    frame = yuyv_frame()
+
+    assert np.array_equal(decoder.process_frame(frame), legacy_process_frame(frame))
+
+
+def test_short_frame_is_padded():
+    decoder = FrameDecoder()
+    frame = yuyv_frame(length=64 * 48)
+
+    assert np.array_equal(decoder.process_frame(frame), legacy_process_frame(frame))
+
+
+def test_luma_is_the_y_plane():
+    decoder = FrameDecoder()
+    frame = yuyv_frame()
+    data = np.frombuffer(frame.data, np.uint8).reshape(48, 64, 2)
+
+    assert np.array_equal(decoder.luma(frame), data[:, :, 0])
+    assert np.array_equal(decoder.luma(frame, 2), data[::2, ::2, 0])
+
+
+def test_decode_benchmark_runs():
+    frames = [yuyv_frame() for _ in range(3)]
+
+    result = measure(FrameDecoder().process_frame, frames, warmup=1)
+
+    assert result["ms_per_frame"] > 0
@@ -0,0 +1,95 @@
+import numpy as np
+from linuxpy.video.device import PixelFormat
+
+from compound_eyes.benchmark import encode_frame_data, synthetic_image
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.recording import make_frame
+
+from conftest import capture
+
+
+def test_gray_is_the_luma_plane_for_yuyv():
+    yuyv = capture(pixel_format=PixelFormat.YUYV)
+    data = np.frombuffer(yuyv.frame.data, np.uint8).reshape(48, 64, 2)
+
+    assert np.array_equal(yuyv.gray, data[:, :, 0])
+    assert not yuyv.gray.flags.writeable
+
+
+def test_reduced_decodes_at_scale():
+    mjpeg = capture()
+
+    assert mjpeg.reduced(2).shape == (24, 32, 3)
+    assert mjpeg.reduced(4, grayscale=True).shape == (12, 16)
+
+
+def test_sole_owner_draws_in_place():
+    only = capture(pixel_format=PixelFormat.YUYV)
+    decoded = only.decoded_frame.get(1)
+
+    assert np.shares_memory(only.writable(), decoded)
+
+
+def test_draws_in_place_when_other_owners_never_looked():
+    # MJPEG decodes outside the pool, so only a copy would use it
+    original = capture()
+    waiting = original.copy()
+
+    drawn = original.writable()
+    drawn[:] = 0
+
+    assert original.decoder.pool._pools == {}
+
+    # The other capture decodes its own clean image when it asks
+    assert np.any(waiting.image)
+    assert not np.shares_memory(waiting.image, drawn)
+
+
+def test_hands_over_a_pooled_image_when_other_owners_never_looked():
+    original = capture(pixel_format=PixelFormat.YUYV)
+    waiting = original.copy()
+
+    drawn = original.writable()
+
+    # Drawn on the pooled buffer itself, not a second one from the pool
+    buffers = original.decoder.pool._pools[(48, 64, 3)]._buffers
+    assert len(buffers) == 1 and buffers[0] is drawn
+    assert not np.shares_memory(waiting.image, drawn)
+
+
+def test_copies_when_another_owner_holds_the_image():
+    original = capture(pixel_format=PixelFormat.YUYV)
+    other = original.copy()
+    seen = other.image
+
+    original.writable()[:] = 0
+
+    assert np.any(seen)
+    assert np.array_equal(other.image, seen)
+
+
+class CountingDecoder(FrameDecoder):
+    def __init__(self):
+        super().__init__()
+        self.decodes = 0
+
+    def process_frame(self, frame_data):
+        self.decodes += 1
+        return super().process_frame(frame_data)
+
+
+def test_pixels_are_decoded_once_on_first_access():
+    decoder = CountingDecoder()
+    data = encode_frame_data(synthetic_image(64, 48), PixelFormat.MJPEG)
+    lazy = Capture(make_frame(data, 64, 48, PixelFormat.MJPEG), decoder)
+    shared = lazy.copy()
+
+    assert not lazy.decoded
+    assert decoder.decodes == 0
+
+    assert lazy.image.shape == (48, 64, 3)
+    # Copies share the decoded frame, so the first decode serves them too
+    assert shared.decoded
+    assert np.array_equal(shared.image, lazy.image)
+    assert decoder.decodes == 1
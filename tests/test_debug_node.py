@@ -0,0 +1,147 @@
+import itertools
+
+import numpy as np
+from linuxpy.video.device import PixelFormat
+from ntcore import NetworkTableInstance
+
+from compound_eyes.benchmark.graph import synthetic_frames
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.debug_server import DebugServer
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.node.stream import DebugNode
+
+# Tables are only readable while their instance is alive; a subtable per test
+instance = NetworkTableInstance.create()
+tables = itertools.count()
+
+
+def make_node():
+    table = instance.getTable("measurements").getSubTable(str(next(tables)))
+    node = DebugNode(
+        "usb-1", DebugServer(0, "127.0.0.1"), Mailbox(), scale=2, table=table
+    )
+    return node, table
+
+
+def test_topics_take_the_type_of_the_value():
+    node, table = make_node()
+
+    node.publish(
+        {
+            "percent_focus": 0.5,
+            "corners_found": 12,
+            "total_corners_found": np.int64(40),
+            "board_visible": True,
+        }
+    )
+
+    assert table.getTopic("percent_focus").getTypeString() == "double"
+    assert table.getTopic("corners_found").getTypeString() == "int"
+    assert table.getTopic("total_corners_found").getTypeString() == "int"
+    assert table.getTopic("board_visible").getTypeString() == "boolean"
+    assert table.getEntry("percent_focus").getDouble(0) == 0.5
+    assert table.getEntry("corners_found").getInteger(0) == 12
+    assert table.getEntry("total_corners_found").getInteger(0) == 40
+    assert table.getEntry("board_visible").getBoolean(False)
+
+
+def test_values_that_are_not_numbers_are_not_published():
+    node, table = make_node()
+
+    node.publish({"label": "board", "corners": np.zeros((4, 2))})
+
+    assert node.publishers == {}
+    assert not table.getTopic("label").exists()
+
+
+def test_a_topic_keeps_its_first_type():
+    node, table = make_node()
+
+    node.publish({"fps": 30})
+    node.publish({"fps": 29.7})
+    node.publish({"fps": "unknown"})
+
+    assert table.getTopic("fps").getTypeString() == "int"
+    assert table.getEntry("fps").getInteger(0) == 29
+
+
+def test_paints_metadata_that_is_not_a_float():
+    node, _ = make_node()
+    image = np.zeros((240, 320, 3), np.uint8)
+
+    node.paint_frame(image, 1.0, {"corners_found": 12, "label": "board", "fps": 30.0})
+
+    assert image.any()
+
+
+def watched(node: DebugNode) -> list:
+    # Stands in for a viewer, recording what would be encoded for it
+    node.stream._active_viewers["viewer"] = (None, None)
+    frames = []
+    node.stream.set_frame = lambda frame, trace=None: frames.append(frame)
+    return frames
+
+
+def feed(node: DebugNode, pixel_format=PixelFormat.MJPEG) -> Capture:
+    frame = synthetic_frames(320, 240, pixel_format, board=False, count=1)[0]
+    capture = Capture(frame, FrameDecoder())
+    node.source.put(capture)
+    assert node.step()
+    return capture
+
+
+def test_nobody_watching_costs_no_decode_or_encode():
+    node, _ = make_node()
+    frames = []
+    node.stream.set_frame = lambda frame, trace=None: frames.append(frame)
+
+    capture = feed(node)
+
+    assert frames == []
+    assert not capture.decoded
+    assert not node.preview()
+
+
+def test_measurements_are_published_without_viewers():
+    node, table = make_node()
+    frame = synthetic_frames(320, 240, PixelFormat.MJPEG, board=False, count=1)[0]
+    capture = Capture(frame, FrameDecoder(), metadata={"percent_focus": 0.5})
+    node.source.put(capture)
+
+    node.step()
+
+    assert table.getEntry("percent_focus").getDouble(0) == 0.5
+
+
+def test_viewers_get_the_overlay_at_stream_scale():
+    node, _ = make_node()
+    frames = watched(node)
+
+    feed(node)
+
+    assert node.preview()
+    assert frames[0].shape == (120, 160, 3)
+
+
+def test_camera_jpeg_passes_through_without_overlay():
+    node, _ = make_node()
+    node.overlay = lambda: False
+    frames = watched(node)
+
+    capture = feed(node)
+
+    assert np.array_equal(frames[0], np.frombuffer(capture.frame.data, np.uint8))
+    assert not capture.decoded
+    # Advertised at the camera's size, not the overlay's
+    assert node.output_size == (320, 240)
+
+
+def test_yuyv_is_never_passed_through():
+    node, _ = make_node()
+    node.overlay = lambda: False
+    frames = watched(node)
+
+    feed(node, PixelFormat.YUYV)
+
+    assert frames[0].shape == (120, 160, 3)
@@ -0,0 +1,80 @@
+import http.client
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from compound_eyes.debug_server import DebugServer
+from mjpeg_streamer.stream import Stream
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    server = DebugServer(free_port(), "127.0.0.1")
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(server: DebugServer, path: str):
+    return urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=2)
+
+
+def test_streams_are_served_by_name(server):
+    registration = server.register("usb-1", Stream("usb-1"), lambda: {"fps": 30})
+
+    assert registration.path == "/cameras/usb-1/stream.mjpg"
+    with get(server, "/cameras/usb-1/metrics") as response:
+        assert json.load(response) == {"fps": 30}
+
+
+def test_replugged_camera_keeps_its_stream(server):
+    old = server.register("usb-1", Stream("usb-1"), lambda: {"camera": 1})
+    new = server.register("usb-1", Stream("usb-1"), lambda: {"camera": 2})
+
+    # The old camera is only stopped once the new one is already serving
+    server.unregister(old)
+
+    assert server.registrations["usb-1"] is new
+    with get(server, "/cameras/usb-1/metrics") as response:
+        assert json.load(response) == {"camera": 2}
+
+
+def test_unregister_ends_its_viewers(server):
+    stream = Stream("usb-1")
+    registration = server.register("usb-1", stream)
+
+    response = get(server, "/cameras/usb-1/stream.mjpg")
+    # The viewer joins after the headers are sent, so keep the frames coming
+    done = threading.Event()
+
+    def feed():
+        while not done.wait(0.02):
+            stream.set_frame(np.zeros((48, 64, 3), dtype=np.uint8))
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    try:
+        assert response.read(64)
+    finally:
+        done.set()
+        feeder.join()
+
+    server.unregister(registration)
+
+    # The handler is cancelled, so the connection is cut rather than left waiting
+    with pytest.raises(http.client.IncompleteRead):
+        response.read()
+    response.close()
+    with pytest.raises(urllib.error.HTTPError):
+        get(server, "/cameras/usb-1/")
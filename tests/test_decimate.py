@@ -0,0 +1,191 @@
+import logging
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from compound_eyes.node import decimate
+from compound_eyes.node.decimate import Decimator
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.node.focus import FocusNode
+
+from conftest import capture
+
+
+class Clock:
+    def __init__(self):
+        self.time = 100.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+def arriving(clock: Clock, age: float = 0.0):
+    return SimpleNamespace(trace=SimpleNamespace(origin=clock.time - age))
+
+
+def admitted(decimator: Decimator, clock: Clock, frames: int, interval: float):
+    admitted = []
+    for _ in range(frames):
+        clock.time += interval
+        admitted.append(decimator.admit(arriving(clock)))
+    return admitted
+
+
+def test_admits_every_frame_by_default(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(decimate, "now", clock)
+
+    assert all(admitted(Decimator(), clock, 10, 1 / 30))
+
+
+def test_spaces_frames_to_the_target_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(decimate, "now", clock)
+    decimator = Decimator(target_rate=10)
+
+    # A 30 fps camera, so every third frame
+    result = admitted(decimator, clock, 30, 1 / 30)
+    assert decimator.every == 3
+    assert result[-9:] == [True, False, False] * 3
+
+
+def test_keeps_up_with_the_service_time(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(decimate, "now", clock)
+    decimator = Decimator()
+    decimator.processed(0.09)
+
+    admitted(decimator, clock, 5, 1 / 30)
+    assert decimator.every == 3
+
+
+def test_refuses_while_busy(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(decimate, "now", clock)
+    decimator = Decimator()
+
+    assert not decimator.admit(arriving(clock), busy=True)
+    assert decimator.late == 0
+
+
+def test_refuses_frames_over_the_latency_budget(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(decimate, "now", clock)
+    decimator = Decimator(latency_budget=0.1)
+
+    assert not decimator.admit(arriving(clock, age=0.2))
+    assert decimator.over_budget
+    assert decimator.late == 1
+
+    assert decimator.admit(arriving(clock, age=0.05))
+    assert not decimator.over_budget
+    assert decimator.late == 1
+
+
+class AdmitFirst(Decimator):
+    def __init__(self):
+        super().__init__()
+        self.admitted = False
+
+    def admit(self, capture, busy=False) -> bool:
+        admitted, self.admitted = not self.admitted, True
+        return admitted
+
+
+def test_skipped_frames_keep_the_last_result():
+    source, sink = Mailbox(), Mailbox()
+    node = FocusNode(source, sink, "test", decimator=AdmitFirst(), preview_scale=2)
+
+    source.put(capture(640, 480))
+    node.step()
+    processed = sink.get_nowait()
+
+    source.put(capture(640, 480))
+    node.step()
+    skipped = sink.get_nowait()
+
+    assert skipped.metadata == processed.metadata
+    # The focus graph is drawn again rather than disappearing for a frame
+    assert (2, False) in skipped._overlays
+    assert node.metrics.skipped == 1
+
+
+def test_skipped_frames_are_untouched_without_preview():
+    source, sink = Mailbox(), Mailbox()
+    node = FocusNode(source, sink, "test", decimator=AdmitFirst(), preview=lambda: False)
+
+    source.put(capture(640, 480))
+    node.step()
+    sink.get_nowait()
+
+    source.put(capture(640, 480))
+    node.step()
+    assert not sink.get_nowait().drawn
+
+
+def test_late_frames_are_counted_and_logged(caplog):
+    source, sink = Mailbox(), Mailbox()
+    node = FocusNode(source, sink, "test", decimator=Decimator(latency_budget=0.1))
+
+    # Synthetic frames are timestamped at 0, long before now
+    with caplog.at_level(logging.INFO):
+        for _ in range(3):
+            source.put(capture(640, 480))
+            node.step()
+            sink.get_nowait()
+
+    assert node.metrics.late == 3
+    assert node.metrics.snapshot()["late"] == 3
+    warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "latency budget" in warnings[0].getMessage()
+
+
+class HeldHost:
+    # Results only come back when the test sets them
+    def __init__(self):
+        self.futures: list[Future] = []
+
+    def submit(self, fn, *args) -> Future:
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+def delivered(node: FocusNode, sink: Mailbox) -> list[int]:
+    node.step()
+    return [sink.get_nowait().frame.frame_nb] if not sink.empty() else []
+
+
+def test_frames_go_out_in_order_while_one_is_pending():
+    source, sink = Mailbox(), Mailbox()
+    host = HeldHost()
+    node = FocusNode(source, sink, "test", host, AdmitFirst(), lambda: False)
+
+    order = []
+    for sequence in range(4):
+        source.put(capture(640, 480, sequence=sequence))
+        order += delivered(node, sink)
+
+    host.futures[0].set_result(0.5)
+    order += delivered(node, sink)
+
+    # Frame 0 finished after frames 1 to 3 went out, so it stays behind
+    assert order == [1, 2, 3]
+    assert node.metrics.processed == 1
+
+    # Its result travels with the next frame instead
+    source.put(capture(640, 480, sequence=4))
+    node.step()
+    assert sink.get_nowait().metadata["percent_focus"] == 1.0
+
+
+def test_pending_frame_is_sent_when_nothing_overtook_it():
+    source, sink = Mailbox(), Mailbox()
+    host = HeldHost()
+    node = FocusNode(source, sink, "test", host, Decimator(), lambda: False)
+
+    source.put(capture(640, 480))
+    assert delivered(node, sink) == []
+
+    host.futures[0].set_result(0.5)
+    node.step()
+    assert sink.get_nowait().metadata["percent_focus"] == 1.0
@@ -0,0 +1,85 @@
+import time
+
+from linuxpy.video.device import PixelFormat
+from ntcore import NetworkTableInstance
+
+from compound_eyes.benchmark.graph import synthetic_frames
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.node.decode import DecodeNode
+from compound_eyes.node.edge import Edge
+
+
+def captures(count: int) -> list[Capture]:
+    decoder = FrameDecoder()
+    frames = synthetic_frames(320, 240, PixelFormat.MJPEG, board=False, count=count)
+    return [Capture(frame, decoder) for frame in frames]
+
+
+def make_node(source: Edge, sink: Edge, workers: int, **kwargs) -> DecodeNode:
+    table = NetworkTableInstance.create().getTable("decode")
+    return DecodeNode(source, sink, "test", workers, table, **kwargs)
+
+
+def drain(node: DecodeNode, sink: Edge, count: int) -> list[Capture]:
+    delivered = []
+    deadline = time.monotonic() + 5
+    while len(delivered) < count and time.monotonic() < deadline:
+        node.step()
+        while not sink.empty():
+            delivered.append(sink.get_nowait())
+        time.sleep(0.001)
+    return delivered
+
+
+def test_decodes_on_the_pool_in_arrival_order():
+    source, sink = Edge(maxsize=8), Edge(maxsize=8)
+    node = make_node(source, sink, workers=2)
+    sent = captures(6)
+    for capture in sent:
+        source.put(capture)
+
+    delivered = drain(node, sink, len(sent))
+    node.stop()
+
+    assert [capture.frame.frame_nb for capture in delivered] == list(range(6))
+    assert all(capture.decoded for capture in delivered)
+    assert node.metrics.processed == 6
+
+
+def test_without_workers_decoding_is_left_to_consumers():
+    source, sink = Edge(maxsize=8), Edge(maxsize=8)
+    node = make_node(source, sink, workers=0)
+    source.put(captures(1)[0])
+
+    assert node.step()
+
+    assert not sink.get_nowait().decoded
+
+
+def test_decodes_only_the_views_in_demand():
+    source, sink = Edge(maxsize=8), Edge(maxsize=8)
+    demand = [(2, True)]
+    node = make_node(source, sink, workers=2, demand=lambda: demand)
+    sent = captures(4)
+    for capture in sent[:2]:
+        source.put(capture)
+    node.step()
+    node.step()
+
+    # Nobody downstream will look at these, but they still wait their turn
+    demand = []
+    for capture in sent[2:]:
+        source.put(capture)
+
+    delivered = drain(node, sink, len(sent))
+    node.stop()
+
+    assert [capture.frame.frame_nb for capture in delivered] == list(range(4))
+    assert not any(capture.decoded for capture in delivered)
+    assert [(2, True) in capture.decoded_frame._images for capture in delivered] == [
+        True,
+        True,
+        False,
+        False,
+    ]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from compound_eyes.device_watcher import DeviceWatcher
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    watcher = DeviceWatcher(tmp_path, debounce=0.2)
+    if watcher.fd is None:
+        pytest.skip("inotify unavailable")
+    yield watcher
+    watcher.close()
+
+
+def later(delay: float, action):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def test_times_out_without_events(watcher):
+    start = time.monotonic()
+    assert not watcher.wait(timeout=0.1)
+    assert time.monotonic() - start < 0.5
+
+
+def test_ignores_other_devices(watcher, tmp_path):
+    later(0.05, (tmp_path / "media0").touch)
+    assert not watcher.wait(timeout=0.3)
+
+
+def test_reports_a_new_video_device(watcher, tmp_path):
+    later(0.05, (tmp_path / "video0").touch)
+    assert watcher.wait(timeout=1)
+
+
+def test_any_event_restarts_the_quiet_period(watcher, tmp_path):
+    # udev keeps creating other nodes after the video node shows up
+    timers = [later(0.05, (tmp_path / "video0").touch)]
+    timers += [
+        later(0.05 + 0.1 * i, (tmp_path / f"media{i}").touch) for i in range(1, 5)
+    ]
+
+    start = time.monotonic()
+    assert watcher.wait(timeout=1)
+    # Last event at 0.45 s, then 0.2 s of quiet
+    assert time.monotonic() - start >= 0.6
+
+    for timer in timers:
+        timer.join()
+
+
+def test_polls_without_inotify(tmp_path):
+    watcher = DeviceWatcher(tmp_path, poll=0.05)
+    watcher.close()
+
+    start = time.monotonic()
+    assert watcher.wait(timeout=1)
+    assert time.monotonic() - start < 0.5
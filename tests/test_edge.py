@@ -0,0 +1,59 @@
+from queue import Empty
+
+import numpy as np
+import pytest
+
+from compound_eyes.node.edge import Broadcast, Mailbox
+
+from conftest import capture
+
+
+def test_mailbox_keeps_the_latest():
+    mailbox = Mailbox()
+    woken = []
+    mailbox.subscribe(lambda: woken.append(True))
+
+    mailbox.put(1)
+    mailbox.put(2)
+
+    assert mailbox.get_nowait() == 2
+    assert (mailbox.puts, mailbox.overwrites) == (2, 1)
+    assert len(woken) == 2
+    with pytest.raises(Empty):
+        mailbox.get_nowait()
+
+
+def test_broadcast_counts_drops_per_consumer():
+    broadcast = Broadcast()
+    fast, slow = broadcast.tap("fast"), broadcast.tap("slow")
+
+    for _ in range(3):
+        broadcast.put(capture())
+        fast.get_nowait()
+
+    assert broadcast.drops() == {"fast": 0, "slow": 2}
+    assert slow.get_nowait() is not None
+
+
+def test_broadcast_tap_names_are_unique():
+    broadcast = Broadcast()
+    broadcast.tap("graph")
+
+    with pytest.raises(ValueError):
+        broadcast.tap("graph")
+
+
+def test_broadcast_consumers_share_pixels_until_one_draws():
+    broadcast = Broadcast()
+    first, second = broadcast.tap("first"), broadcast.tap("second")
+    broadcast.put(capture())
+    a, b = first.get_nowait(), second.get_nowait()
+
+    assert a is not b
+    assert a.decoded_frame is b.decoded_frame
+    clean = b.image.copy()
+
+    a.writable()[:] = 0
+
+    assert not np.any(a.image)
+    assert np.array_equal(b.image, clean)
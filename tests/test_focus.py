@@ -0,0 +1,18 @@
+from compound_eyes.datatypes import FULL
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.node.focus import FocusNode
+
+from conftest import capture
+
+
+def test_paints_at_preview_scale():
+    source, sink = Mailbox(), Mailbox()
+    node = FocusNode(source, sink, "test", preview_scale=2)
+    source.put(capture(640, 480))
+
+    node.step()
+
+    painted = sink.get_nowait()
+    assert 0 < painted.metadata["percent_focus"] <= 1
+    assert (2, False) in painted._overlays
+    assert FULL not in painted._overlays
@@ -0,0 +1,57 @@
+import json
+
+from ntcore import NetworkTableInstance
+
+from compound_eyes.metrics import Histogram, MetricsPublisher, NodeMetrics
+
+# Tables are only readable while their instance is alive
+instance = NetworkTableInstance.create()
+
+
+def test_percentiles_are_bucket_bounds():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in [0.0005] * 50 + [0.005] * 45 + [0.05] * 5:
+        histogram.record(value)
+
+    assert histogram.percentile(50) == 0.001
+    assert histogram.percentile(95) == 0.01
+    assert histogram.percentile(99) == 0.1
+
+
+def test_empty_histogram():
+    assert Histogram().percentile(99) == 0.0
+    assert Histogram().snapshot()["mean_ms"] == 0.0
+
+
+def test_overflow_is_clamped_to_the_last_bound():
+    histogram = Histogram((0.001, 0.01))
+    histogram.record(5.0)
+
+    assert histogram.percentile(50) == 0.01
+    assert histogram.snapshot()["buckets_ms"] == {"1": 0, "10": 0, "inf": 1}
+
+
+def test_snapshot_is_valid_json():
+    metrics = NodeMetrics()
+    metrics.service_time.record(30.0)
+    metrics.input_age.record(0.002)
+
+    # /metrics is served with json_response, which must not see Infinity
+    text = json.dumps(metrics.snapshot(), allow_nan=False)
+    assert json.loads(text)["service_time"]["p99_ms"] == 1000.0
+
+
+def test_publisher_nests_subtables_and_skips_buckets():
+    table = instance.getTable("nodes")
+    metrics = NodeMetrics()
+    metrics.processed = 3
+    metrics.service_time.record(0.004)
+
+    # Topics live as long as their publishers
+    publisher = MetricsPublisher(table)
+    publisher.publish({"FocusNode_usb-1": metrics.snapshot()})
+
+    node = table.getSubTable("FocusNode_usb-1")
+    assert node.getEntry("processed").getDouble(0) == 3
+    assert node.getSubTable("service_time").getEntry("p50_ms").getDouble(0) == 5
+    assert node.getSubTable("service_time").getSubTables() == []
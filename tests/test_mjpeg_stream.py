@@ -0,0 +1,150 @@
+import asyncio
+from concurrent.futures import Executor, Future
+
+import cv2
+import numpy as np
+import pytest
+
+from mjpeg_streamer.stream import Stream, _check_encoding
+
+
+def jpeg(width=64, height=48, padding=0):
+    image = np.full((height, width, 3), 128, np.uint8)
+    data = cv2.imencode(".jpg", image)[1]
+    return np.concatenate([data, np.zeros(padding, np.uint8)])
+
+
+def test_check_encoding():
+    assert _check_encoding(jpeg()) == "jpg"
+    assert _check_encoding(jpeg(padding=100)) == "jpg"
+    assert _check_encoding(jpeg()[:-10]) == "one-dim-non-jpg"
+    assert _check_encoding(np.zeros((4, 4, 3), np.uint8)) == "multi-dim"
+
+
+def test_padded_jpeg_passes_through_without_padding():
+    frame = jpeg(padding=100)
+
+    encoded = Stream("test")._encode(frame)
+
+    assert encoded.size == frame.size - 100
+    assert np.array_equal(encoded, frame[:-100])
+
+
+def test_padded_jpeg_is_decoded_to_resize():
+    encoded = Stream("test", size=(32, 24))._encode(jpeg(padding=100))
+
+    assert cv2.imdecode(encoded, cv2.IMREAD_COLOR).shape == (24, 32, 3)
+
+
+def test_buffer_that_is_not_a_jpeg_is_not_encoded_as_pixels():
+    with pytest.raises(ValueError):
+        Stream("test")._encode(np.arange(100, dtype=np.uint8))
+
+
+class InlineExecutor(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_cache_holds_every_watched_variant():
+    async def watch():
+        stream = Stream("test", encoder=InlineExecutor())
+        variants = [stream._variant(None, quality) for quality in range(10, 100, 8)]
+        assert len(variants) > stream.cache_size
+        for variant in variants:
+            await stream._add_viewer(variant=variant)
+
+        image = np.full((48, 64, 3), 128, np.uint8)
+        stream.set_frame(image)
+        stream.set_frame(image)
+
+        # A viewer still sending the first frame finds the second one waiting too
+        for sequence in (1, 2):
+            for variant in variants:
+                assert stream._cache_get((sequence, variant)) is not None
+
+        for variant in variants:
+            sequence, _, _ = await asyncio.wait_for(stream._wait_frame(1, variant), 1)
+            assert sequence == 2
+
+    asyncio.run(watch())
+
+
+class CountingStream(Stream):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded = []
+
+    def _encode_variants(self, frame, variants):
+        self.encoded.append(len(variants))
+        return super()._encode_variants(frame, variants)
+
+
+def test_each_frame_is_encoded_once_for_every_viewer():
+    async def watch():
+        stream = CountingStream("test", encoder=InlineExecutor())
+        for _ in range(3):
+            await stream._add_viewer()
+
+        waiting = [
+            asyncio.create_task(stream._wait_frame(0, (None, None))) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        stream.set_frame(np.full((48, 64, 3), 128, np.uint8))
+
+        results = await asyncio.wait_for(asyncio.gather(*waiting), 1)
+        # Every waiting viewer was woken with the same JPEG
+        assert all(result[1] is results[0][1] for result in results)
+        assert stream.encoded == [1]
+
+    asyncio.run(watch())
+
+
+def test_nothing_is_encoded_without_viewers():
+    stream = CountingStream("test", encoder=InlineExecutor())
+
+    stream.set_frame(np.full((48, 64, 3), 128, np.uint8))
+
+    assert stream.encoded == []
+
+
+class HeldExecutor(Executor):
+    # Runs submitted encodes only when told to, like a pool that is busy
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.queued.append((fn, args, kwargs))
+        return Future()
+
+    def run_next(self):
+        fn, args, kwargs = self.queued.pop(0)
+        fn(*args, **kwargs)
+
+
+def test_frames_set_while_encoding_keep_only_the_latest():
+    async def watch():
+        encoder = HeldExecutor()
+        stream = CountingStream("test", encoder=encoder)
+        await stream._add_viewer()
+
+        for value in (10, 20, 30, 40):
+            stream.set_frame(np.full((48, 64, 3), value, np.uint8))
+
+        # One encode in flight per stream, however fast frames are set
+        assert len(encoder.queued) == 1
+        encoder.run_next()
+        assert stream._encoded[0] == 1
+
+        # Frames 2 and 3 were replaced before the encoder got to them
+        assert len(encoder.queued) == 1
+        encoder.run_next()
+        assert stream._encoded[0] == 4
+        assert encoder.queued == []
+
+        stats = stream.get_encode_stats()
+        assert stats["encodes"] == 2
+
+    asyncio.run(watch())
@@ -0,0 +1,65 @@
+import time
+
+from ntcore import NetworkTableInstance
+
+from compound_eyes.node import FpsNode, Mailbox, ModeGraph
+from compound_eyes.node.scheduler import Scheduler
+
+from conftest import capture
+
+
+def make_graph(scheduler: Scheduler) -> ModeGraph:
+    table = NetworkTableInstance.create().getTable("nodes")
+    graph = ModeGraph("usb-1", scheduler, table, Mailbox(), Mailbox())
+    for mode in ("setup", "focus"):
+        graph.add_mode(
+            mode,
+            lambda source, sink, mode=mode: FpsNode(source, sink, f"{mode}_a"),
+            lambda source, sink, mode=mode: FpsNode(source, sink, f"{mode}_b"),
+        )
+    return graph
+
+
+def delivered(graph: ModeGraph) -> str:
+    deadline = time.monotonic() + 2
+    while graph.sink.empty() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return next(key for key in graph.sink.get_nowait().metadata if key.endswith("_b"))
+
+
+def test_only_the_active_branch_runs():
+    scheduler = Scheduler(2)
+    graph = make_graph(scheduler)
+
+    graph.activate("focus")
+    graph.source.put(capture())
+    assert delivered(graph) == "FpsNode_focus_b"
+
+    graph.activate("setup")
+    graph.source.put(capture())
+    assert delivered(graph) == "FpsNode_setup_b"
+    assert all(node.metrics.processed == 1 for node in graph.modes["focus"])
+
+    graph.stop()
+    scheduler.shutdown()
+
+
+def test_switching_drops_frames_left_inside_the_old_branch():
+    scheduler = Scheduler(1)
+    graph = make_graph(scheduler)
+    graph.activate("focus")
+
+    # Stranded between the branch's two nodes when the mode changed
+    middle = graph.branch_edges["focus"][0]
+    scheduler.suspend(graph.modes["focus"][1])
+    graph.source.put(capture())
+    deadline = time.monotonic() + 2
+    while middle.empty() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not middle.empty()
+
+    graph.activate("setup")
+
+    assert middle.empty()
+    graph.stop()
+    scheduler.shutdown()
@@ -0,0 +1,117 @@
+import subprocess
+import sys
+import textwrap
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pytest
+from linuxpy.video.device import PixelFormat
+
+from compound_eyes.benchmark.graph import synthetic_frames
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.node.focus import FocusNode
+from compound_eyes.process_host import ProcessHost, attach
+
+
+def total(image: np.ndarray) -> int:
+    return int(image.sum())
+
+
+def slow(image: np.ndarray, seconds: float) -> int:
+    time.sleep(seconds)
+    return image.size
+
+
+@pytest.fixture
+def host():
+    host = ProcessHost(1, slots=1)
+    host.start()
+    yield host
+    host.stop()
+
+
+def test_runs_kernels_on_shared_memory(host):
+    # Each size grows the slot, so the worker has to reattach
+    for size in (10, 1000, 100000):
+        assert host.submit(total, np.ones(size, np.uint8)).result(10) == size
+
+
+def test_refuses_frames_when_every_slot_is_taken(host):
+    pending = host.submit(slow, np.ones(4, np.uint8), 0.5)
+
+    start = time.monotonic()
+    assert host.submit(total, np.ones(4, np.uint8)) is None
+    assert time.monotonic() - start < 0.1
+    assert host.refused == 1
+
+    assert pending.result(10) == 4
+    assert host.submit(total, np.ones(4, np.uint8)).result(10) == 4
+
+
+def test_attaching_leaves_the_resource_tracker_alone(monkeypatch):
+    registered = []
+    monkeypatch.setattr(
+        resource_tracker, "register", lambda name, rtype: registered.append(name)
+    )
+    owner = shared_memory.SharedMemory(create=True, size=16)
+    registered.clear()
+
+    attached = attach(owner.name)
+    attached.close()
+    owner.close()
+    owner.unlink()
+
+    assert registered == []
+
+
+def test_workers_do_not_upset_the_resource_tracker(tmp_path):
+    script = tmp_path / "host.py"
+    script.write_text(
+        textwrap.dedent(
+            """
+            import numpy as np
+            from compound_eyes.process_host import ProcessHost
+            from test_process_host import total
+
+            if __name__ == "__main__":
+                host = ProcessHost(2)
+                host.start()
+                for size in (10, 1000, 100000):
+                    futures = [host.submit(total, np.ones(size, np.uint8)) for _ in range(4)]
+                    [future.result(10) for future in futures]
+                host.stop()
+            """
+        )
+    )
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        capture_output=True,
+        text=True,
+        timeout=60,
+        env={"PYTHONPATH": ":".join(sys.path)},
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "resource_tracker" not in result.stderr
+    assert "leaked" not in result.stderr
+
+
+class BusyHost:
+    def submit(self, kernel, image, *args):
+        return None
+
+
+def test_nodes_skip_frames_the_host_refuses():
+    source, sink = Mailbox(), Mailbox()
+    node = FocusNode(source, sink, "test", host=BusyHost())
+    frame = synthetic_frames(320, 240, PixelFormat.MJPEG, board=False, count=1)[0]
+    source.put(Capture(frame, FrameDecoder()))
+
+    assert node.step()
+
+    assert node.pending is None
+    assert "percent_focus" not in sink.get_nowait().metadata
+    assert node.metrics.skipped == 1
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import numpy as np
+from linuxpy.video.device import BufferType, PixelFormat
+
+from compound_eyes.recording import FrameRecorder, ReplayDevice, make_frame
+
+
+def test_make_frame():
+    data = bytes(range(256)) * 12
+    frame = make_frame(data, 32, 48, PixelFormat.YUYV, sequence=7, timestamp=12.5)
+
+    assert frame.format.width == 32
+    assert frame.format.height == 48
+    assert frame.format.pixel_format == PixelFormat.YUYV
+    assert frame.format.size == len(data)
+    assert frame.frame_nb == 7
+    assert frame.timestamp == 12.5
+    assert bytes(frame.data) == data
+
+
+def test_record_and_replay(tmp_path):
+    path = tmp_path / "camera.frames"
+    device = SimpleNamespace(
+        info=SimpleNamespace(bus_info="usb-1", driver="uvc", card="cam")
+    )
+    recorder = FrameRecorder(path, device)
+    frames = [
+        make_frame(bytes([i]) * 32 * 16 * 2, 32, 16, PixelFormat.YUYV, i, i / 30)
+        for i in range(3)
+    ]
+    for frame in frames:
+        recorder.write(frame)
+    recorder.close()
+
+    replay = ReplayDevice(path, speed=None, loop=False)
+    replay.open()
+    replayed = list(replay)
+
+    assert replay.info.card == "cam"
+    assert [frame.frame_nb for frame in replayed] == [0, 1, 2]
+    for original, frame in zip(frames, replayed):
+        assert np.array_equal(
+            np.frombuffer(frame.data, np.uint8), np.frombuffer(original.data, np.uint8)
+        )
+
+    format = replay.get_format(BufferType.VIDEO_CAPTURE)
+    assert (format.width, format.height) == (32, 16)
+    assert format.pixel_format == PixelFormat.YUYV
@@ -0,0 +1,116 @@
+import threading
+import time
+from queue import Empty
+
+from compound_eyes.node import Node
+from compound_eyes.node.edge import Edge
+from compound_eyes.node.scheduler import Scheduler
+
+
+class Counter(Node):
+    # Takes whatever is on its input, slowly, and notes if it ever ran twice at once
+    def __init__(self, source: Edge, delay: float = 0.0):
+        self.source = source
+        self.delay = delay
+        self.seen = []
+        self.steps = 0
+        self.running = 0
+        self.overlapped = False
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+        super().__init__("counter")
+
+    def step(self) -> bool:
+        self.steps += 1
+        try:
+            item = self.source.get_nowait()
+        except Empty:
+            return False
+
+        with self._lock:
+            self.running += 1
+            self.overlapped |= self.running > 1
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+
+        self.seen.append(item)
+        self.done.set()
+        return True
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_nodes_run_when_their_input_is_written():
+    scheduler = Scheduler(2)
+    source = Edge(maxsize=4)
+    node = Counter(source)
+    scheduler.add(node)
+
+    # Added nodes look at their input once, then nothing polls them
+    time.sleep(0.05)
+    steps = node.steps
+    time.sleep(0.05)
+    assert node.steps == steps <= 1
+
+    source.put(1)
+    assert node.done.wait(2)
+    assert node.seen == [1]
+
+    scheduler.remove(node)
+    scheduler.shutdown()
+
+
+def test_a_node_never_runs_on_two_workers_at_once():
+    scheduler = Scheduler(4)
+    source = Edge(maxsize=100)
+    node = Counter(source, delay=0.002)
+    scheduler.add(node)
+
+    for i in range(50):
+        source.put(i)
+
+    assert wait_for(lambda: len(node.seen) == 50)
+    assert not node.overlapped
+    assert node.seen == list(range(50))
+
+    scheduler.remove(node)
+    scheduler.shutdown()
+
+
+def test_suspended_nodes_pick_up_on_resume():
+    scheduler = Scheduler(1)
+    source = Edge(maxsize=4)
+    node = Counter(source)
+    scheduler.add(node, suspended=True)
+
+    source.put(1)
+    time.sleep(0.05)
+    assert node.seen == []
+
+    scheduler.resume(node)
+    assert wait_for(lambda: node.seen == [1])
+
+    scheduler.remove(node)
+    scheduler.shutdown()
+
+
+def test_remove_waits_for_the_step_in_progress():
+    scheduler = Scheduler(1)
+    source = Edge(maxsize=4)
+    node = Counter(source, delay=0.2)
+    scheduler.add(node)
+    source.put(1)
+    assert wait_for(lambda: node.running == 1)
+
+    scheduler.remove(node)
+
+    assert node.running == 0
+    assert node.seen == [1]
+    scheduler.shutdown()
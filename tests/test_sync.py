@@ -0,0 +1,94 @@
+from ntcore import NetworkTableInstance
+
+from compound_eyes.node.edge import Mailbox
+from compound_eyes.node.sync import FrameSynchronizer, SyncNode
+from compound_eyes.recording import make_frame
+from compound_eyes.convert_frame import FrameDecoder
+from compound_eyes.datatypes import Capture
+from linuxpy.video.device import PixelFormat
+
+
+def synchronizer(*cameras: str, tolerance=0.005, buffer=4) -> FrameSynchronizer:
+    synchronizer = FrameSynchronizer(tolerance, buffer)
+    for camera in cameras:
+        synchronizer.add_camera(camera)
+    return synchronizer
+
+
+def test_matches_within_tolerance():
+    sync = synchronizer("a", "b")
+
+    assert sync.add("a", 1.000, "a1") == []
+    (bundle,) = sync.add("b", 1.003, "b1")
+
+    assert bundle.captures == {"a": "a1", "b": "b1"}
+    assert abs(bundle.skew - 0.003) < 1e-9
+    assert abs(bundle.timestamp - 1.0015) < 1e-9
+    assert sync.stats()["bundles"] == 1
+
+
+def test_drops_frames_that_cannot_match():
+    sync = synchronizer("a", "b")
+
+    sync.add("a", 1.000, "a1")
+    sync.add("a", 1.033, "a2")
+    (bundle,) = sync.add("b", 1.034, "b1")
+
+    assert bundle.captures == {"a": "a2", "b": "b1"}
+    assert sync.dropped == {"a": 1, "b": 0}
+
+
+def test_buffers_are_bounded():
+    sync = synchronizer("a", "b", buffer=2)
+
+    for i in range(5):
+        sync.add("a", i, i)
+
+    assert len(sync.buffers["a"]) == 2
+    assert sync.dropped["a"] == 3
+
+
+def test_single_camera_holds_nothing():
+    sync = synchronizer("a")
+
+    assert sync.add("a", 1.0, "a1") == []
+    assert len(sync.buffers["a"]) == 0
+
+
+def test_removing_a_camera_releases_the_rest():
+    sync = synchronizer("a", "b")
+    sync.add("a", 1.0, "a1")
+
+    sync.remove_camera("b")
+
+    assert len(sync.buffers["a"]) == 0
+
+
+def capture(timestamp: float) -> Capture:
+    frame = make_frame(bytes(32 * 16 * 2), 32, 16, PixelFormat.YUYV, 0, timestamp)
+    return Capture(frame, FrameDecoder())
+
+
+def test_node_only_bundles_captures_for_a_subscriber():
+    sink = Mailbox()
+    node = SyncNode(sink, NetworkTableInstance.create().getTable("sync"))
+    a, b = Mailbox(), Mailbox()
+    node.attach("a", a)
+    node.attach("b", b)
+
+    a.put(capture(1.0))
+    b.put(capture(1.001))
+    node.step()
+
+    # Matched for the stats, but nothing is kept for a consumer that isn't there
+    assert node.synchronizer.bundles == 1
+    assert sink.empty()
+
+    sink.subscribe(lambda: None)
+    a.put(capture(2.0))
+    b.put(capture(2.001))
+    node.step()
+
+    bundle = sink.get_nowait()
+    assert set(bundle.captures) == {"a", "b"}
+    assert abs(bundle.captures["b"].frame.timestamp - 2.001) < 1e-5
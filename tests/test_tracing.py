@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from ntcore import NetworkTableInstance
+
+from compound_eyes import tracing
+from compound_eyes.tracing import LatencyTracker, Trace
+
+
+class Clock:
+    def __init__(self):
+        self.time = 10.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tracing, "now", clock)
+    return clock
+
+
+def test_stages_are_timed_from_enter_to_exit(clock):
+    trace = Trace(origin=9.0, sequence=1)
+
+    trace.enter("focus")
+    clock.time += 0.02
+    assert trace.exit("focus") == pytest.approx(0.02)
+    # A stage that was never entered has nothing to close
+    assert trace.exit("debug") is None
+
+    durations = trace.durations()
+    assert durations["focus"] == pytest.approx(0.02)
+    assert durations["total"] == pytest.approx(1.02)
+
+
+def test_copies_share_frame_spans_only(clock):
+    shared = []
+    trace = Trace(origin=9.0, sequence=1, shared=shared)
+    shared.append(("decode", 9.5, 9.6))
+    trace.add_span("dequeue", 9.0, 9.1)
+
+    copy = trace.copy()
+    copy.add_span("stream", 9.7, 9.8)
+
+    assert [stage for stage, _, _ in trace.spans] == ["dequeue", "decode"]
+    assert [stage for stage, _, _ in copy.spans] == ["dequeue", "decode", "stream"]
+
+
+def make_tracker() -> LatencyTracker:
+    table = NetworkTableInstance.create().getTable("latency")
+    return LatencyTracker(table, "usb-1", window=10)
+
+
+def test_tracker_reports_percentiles_per_stage():
+    tracker = make_tracker()
+    for i in range(20):
+        trace = Trace(origin=0.0, sequence=i)
+        trace.add_span("encode", 0.0, 0.001 * (i + 1))
+        tracker.record(trace)
+
+    stats = tracker.stats()
+
+    # Only the last window's worth of frames count
+    assert len(tracker.traces) == 10
+    assert stats["encode"][50] == pytest.approx(0.0155)
+    assert stats["total"][99] == pytest.approx(0.01991)
+
+
+def test_chrome_trace_export(tmp_path):
+    tracker = make_tracker()
+    trace = Trace(origin=1.0, sequence=7)
+    trace.add_span("decode", 1.0, 1.005)
+    tracker.record(trace)
+
+    path = tmp_path / "traces" / "usb-1.json"
+    tracker.export_chrome_trace(path)
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [event["name"] for event in events] == ["v4l2", "decode"]
+    assert events[1]["dur"] == pytest.approx(5000)
+    assert events[1]["args"] == {"frame": 7}